@@ -0,0 +1,219 @@
+"""
+Decode columns of numbers directly from raw BSON into numpy arrays.
+
+Each page of a column comes back from MongoDB as one document like
+``{"_id": ..., "x": [row, row, ...]}``. Decoding that with the bson library
+creates a Python object for every number, which we then copy into a numpy
+array, sometimes twice. When every row is a number, or a (nested) array of
+numbers with the expected shape, the layout of the BSON is fully determined
+by the number of rows and the row shape, so we can locate every value with
+numpy and copy all of them at once.
+"""
+import functools
+import struct
+
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+# BSON element type codes for values that map directly onto a numpy dtype
+LEAF_DTYPES = {
+    0x01: numpy.dtype("<f8"),  # double
+    0x08: numpy.dtype("?"),  # boolean
+    0x10: numpy.dtype("<i4"),  # int32
+    0x12: numpy.dtype("<i8"),  # int64
+}
+ARRAY = 0x04
+# Sizes of the values of BSON types with a fixed size
+_FIXED_SIZES = {
+    0x01: 8,
+    0x06: 0,
+    0x07: 12,
+    0x08: 1,
+    0x09: 8,
+    0x0A: 0,
+    0x10: 4,
+    0x11: 8,
+    0x12: 8,
+    0x13: 16,
+    0x7F: 0,
+    0xFF: 0,
+}
+_INT32 = struct.Struct("<i")
+
+
+def field_offsets(raw):
+    """
+    Map each top-level key of a BSON document to (type code, offset of value).
+
+    Parameters
+    ----------
+    raw : bytes
+        One encoded BSON document
+    """
+    offsets = {}
+    position = 4
+    end = len(raw) - 1
+    while position < end:
+        type_code = raw[position]
+        key_end = raw.index(b"\x00", position + 1)
+        key = raw[position + 1:key_end].decode()
+        value = key_end + 1
+        offsets[key] = (type_code, value)
+        if type_code in _FIXED_SIZES:
+            size = _FIXED_SIZES[type_code]
+        elif type_code in (0x02, 0x0D, 0x0E):  # string, code, symbol
+            size = 4 + _INT32.unpack_from(raw, value)[0]
+        elif type_code in (0x03, 0x04):  # document, array
+            size = _INT32.unpack_from(raw, value)[0]
+        elif type_code == 0x05:  # binary
+            size = 5 + _INT32.unpack_from(raw, value)[0]
+        else:
+            raise ValueError(f"Cannot skip over BSON type {type_code:#x}")
+        position = value + size
+    return offsets
+
+
+def _num_digits(n):
+    "Length of str(i) for i in range(n), which are the keys of a BSON array"
+    indexes = numpy.arange(n)
+    digits = numpy.ones(n, dtype=numpy.int64)
+    power = 10
+    while power < n:
+        digits += indexes >= power
+        power *= 10
+    return digits
+
+
+def _exclusive_cumsum(sizes):
+    result = numpy.zeros(len(sizes), dtype=numpy.int64)
+    numpy.cumsum(sizes[:-1], out=result[1:])
+    return result
+
+
+class _RowLayout:
+    """
+    Where things are in the BSON encoding of one row of a given shape.
+
+    All positions are relative to the start of the row's value.
+    """
+
+    def __init__(self, size, leaf_offsets, leaf_types, array_types, lengths, expected_lengths):
+        self.size = size  # total size of the row's value
+        self.leaf_offsets = leaf_offsets  # shape: row_shape
+        self.leaf_types = leaf_types  # type codes that must match the leaf type
+        self.array_types = array_types  # type codes that must be ARRAY
+        self.lengths = lengths  # int32 length prefixes of (nested) arrays
+        self.expected_lengths = expected_lengths
+
+
+@functools.lru_cache(maxsize=128)
+def _row_layout(row_shape, leaf_size):
+    empty = numpy.empty(0, dtype=numpy.int64)
+    if not row_shape:
+        return _RowLayout(leaf_size, numpy.zeros((), dtype=numpy.int64), empty, empty, empty, empty)
+    n, *rest = row_shape
+    inner = _row_layout(tuple(rest), leaf_size)
+    digits = _num_digits(n)
+    element_sizes = 2 + digits + inner.size  # type code, key, NUL, value
+    type_positions = 4 + _exclusive_cumsum(element_sizes)
+    value_positions = type_positions + 2 + digits
+    size = 4 + int(element_sizes.sum()) + 1
+    leaf_offsets = value_positions.reshape(n, *([1] * len(rest))) + inner.leaf_offsets
+    column = value_positions[:, numpy.newaxis]
+    if rest:
+        leaf_types = (column + inner.leaf_types).ravel()
+        array_types = numpy.concatenate([type_positions, (column + inner.array_types).ravel()])
+    else:
+        leaf_types = type_positions
+        array_types = empty
+    lengths = numpy.concatenate([[0], (column + inner.lengths).ravel()])
+    expected_lengths = numpy.concatenate([[size], numpy.tile(inner.expected_lengths, n)])
+    return _RowLayout(size, leaf_offsets, leaf_types, array_types, lengths, expected_lengths)
+
+
+def _read_int32s(rows, positions):
+    "Read little-endian int32 at each of positions in each row of a uint8 array."
+    indexes = positions[:, numpy.newaxis] + numpy.arange(4)
+    return numpy.ascontiguousarray(rows[:, indexes]).view("<i4")[..., 0]
+
+
+def decode_array(raw, offset, row_shape, max_rows, dtype=None):
+    """
+    Decode the BSON array at ``raw[offset:]`` into a numpy array of rows.
+
+    Parameters
+    ----------
+    raw : bytes
+        An encoded BSON document
+    offset : int
+        Position of the array's value within raw
+    row_shape : tuple
+        The shape of each row, () for scalars
+    max_rows : int
+        Upper bound on the number of rows
+    Returns
+    -------
+    array : numpy.ndarray or None
+        None if the array is not made of rows of numbers of one type with
+        exactly ``row_shape``. The caller should then decode it the usual way.
+    """
+    row_shape = tuple(row_shape)
+    doc_size = _INT32.unpack_from(raw, offset)[0]
+    if doc_size == 5:
+        # An empty array
+        return numpy.empty((0, *row_shape), dtype=dtype)
+    # Descend through the first element of each level to find the leaf type.
+    position = offset
+    for _ in row_shape:
+        if raw[position + 4] != ARRAY:
+            return None
+        position += 4 + 3  # length, type code, key "0", NUL
+    leaf_type = raw[position + 4]
+    if leaf_type not in LEAF_DTYPES:
+        return None
+    leaf_dtype = LEAF_DTYPES[leaf_type]
+    if dtype is None:
+        # Python ints become int64 whether BSON stored them as int32 or int64.
+        dtype = numpy.dtype("<i8") if leaf_dtype.kind == "i" else leaf_dtype
+    elif not numpy.can_cast(leaf_dtype, dtype, "safe"):
+        return None
+    row = _row_layout(row_shape, leaf_dtype.itemsize)
+
+    # Infer the number of rows from the size of the array.
+    digits = _num_digits(max_rows)
+    element_sizes = 2 + digits + row.size
+    ends = 4 + numpy.cumsum(element_sizes) + 1
+    num_rows = 1 + int(numpy.searchsorted(ends, doc_size))
+    if (num_rows > max_rows) or (ends[num_rows - 1] != doc_size):
+        return None
+    digits = digits[:num_rows]
+    type_positions = offset + 4 + _exclusive_cumsum(element_sizes[:num_rows])
+    value_positions = type_positions + 2 + digits
+
+    buffer = numpy.frombuffer(raw, dtype=numpy.uint8)
+    if not (buffer[type_positions] == (ARRAY if row_shape else leaf_type)).all():
+        return None
+    out = numpy.empty((num_rows, *row_shape), dtype=dtype)
+    leaf_bytes = (
+        row.leaf_offsets.ravel()[:, numpy.newaxis] + numpy.arange(leaf_dtype.itemsize)
+    ).ravel()
+    # Rows whose keys have the same number of digits are evenly spaced, so
+    # each such segment can be viewed as a 2D (rows x bytes) array.
+    for num_digits in numpy.unique(digits):
+        (indexes,) = numpy.nonzero(digits == num_digits)
+        start, stop = indexes[0], indexes[-1] + 1
+        rows = as_strided(
+            buffer[value_positions[start]:],
+            shape=(stop - start, row.size),
+            strides=(int(2 + num_digits + row.size), 1),
+            writeable=False,
+        )
+        if not (
+            (rows[:, row.leaf_types] == leaf_type).all()
+            and (rows[:, row.array_types] == ARRAY).all()
+            and (_read_int32s(rows, row.lengths) == row.expected_lengths).all()
+        ):
+            return None
+        values = numpy.ascontiguousarray(rows[:, leaf_bytes]).view(leaf_dtype)
+        out[start:stop] = values.reshape(stop - start, *row_shape)
+    return out
@@ -0,0 +1,90 @@
+"""
+Compress streamed responses so that each chunk can be decoded on arrival.
+
+Each chunk sent is compressed and flushed on its own: with zstd as a
+complete frame, with gzip as a sync-flushed block of one gzip member.
+Decoding handles any number of concatenated zstd frames or gzip members.
+"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Supported encodings, most preferred first
+if zstandard is not None:
+    ENCODINGS = ("zstd", "gzip")
+else:
+    ENCODINGS = ("gzip",)
+ZSTD_LEVEL = 3
+# Favor speed: much of the data is packed numbers, which compress poorly.
+GZIP_LEVEL = 1
+
+
+def accepted_encodings(accept_encoding):
+    "Return the set of encodings named in the value of an Accept-Encoding header."
+    return {item.split(";")[0].strip() for item in accept_encoding.split(",")} - {""}
+
+
+def negotiate(accept_encoding):
+    """
+    Choose an encoding given the value of an Accept-Encoding header.
+
+    Returns None if none of the supported encodings is acceptable.
+    """
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in ENCODINGS:
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def compress(chunks, encoding):
+    "Compress an iterable of bytes, yielding one decodable chunk for each."
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        for chunk in chunks:
+            if chunk:
+                yield compressor.compress(chunk)
+    elif encoding == "gzip":
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    else:
+        raise ValueError(f"Unsupported encoding {encoding!r}")
+
+
+def decompress(chunks, encoding):
+    """
+    Decompress an iterable of bytes compressed with encoding.
+
+    If encoding is None or "identity", the chunks are passed through.
+    """
+    if encoding in (None, "identity"):
+        yield from chunks
+        return
+    if encoding == "zstd" and zstandard is not None:
+        decompressor = zstandard.ZstdDecompressor()
+        new_decompressobj = decompressor.decompressobj
+    elif encoding == "gzip":
+
+        def new_decompressobj():
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    else:
+        raise ValueError(f"Unsupported encoding {encoding!r}")
+    decompressobj = new_decompressobj()
+    for chunk in chunks:
+        while chunk:
+            data = decompressobj.decompress(chunk)
+            if data:
+                yield data
+            if decompressobj.eof:
+                # This frame (or member) is done. Start on the next one.
+                chunk = decompressobj.unused_data
+                decompressobj = new_decompressobj()
+            else:
+                chunk = b""
@@ -0,0 +1,86 @@
+"""
+Decode streams of documents that arrive in arbitrary chunks of bytes.
+
+The chunks of an HTTP stream need not line up with the items in it. These
+decoders hold the incomplete end of the stream in a buffer until the next
+chunk completes it, and decode each item only as it is iterated over.
+"""
+import json
+
+import msgpack
+
+from . import _msgpack_arrays
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONSeqDecoder:
+    "Decode newline-delimited JSON."
+
+    def __init__(self):
+        self._buffer = bytearray()
+        # Position in the buffer where the next item starts
+        self._start = 0
+        # Position in the buffer up to which there is no newline
+        self._scanned = 0
+
+    def feed(self, chunk):
+        "Add chunk to the stream, and iterate over the items it completes."
+        # Drop the items already decoded, reusing the buffer's memory.
+        del self._buffer[: self._start]
+        self._scanned -= self._start
+        self._start = 0
+        self._buffer += chunk
+        return self._items()
+
+    def _items(self):
+        while True:
+            end = self._buffer.find(b"\n", max(self._start, self._scanned))
+            if end == -1:
+                self._scanned = len(self._buffer)
+                return
+            start, self._start = self._start, end + 1
+            if end > start:
+                yield self._loads(start, end)
+
+    def _loads(self, start, end):
+        if orjson is None:
+            return json.loads(self._buffer[start:end])
+        # Parse the line in place, without copying it out of the buffer.
+        with memoryview(self._buffer) as buffer, buffer[start:end] as line:
+            return orjson.loads(line)
+
+    def close(self):
+        "End the stream, and return the last item if it had no newline."
+        tail = bytes(self._buffer[self._start:]).strip()
+        self._buffer.clear()
+        self._start = self._scanned = 0
+        if not tail:
+            return []
+        try:
+            return [json.loads(tail)]
+        except ValueError:
+            raise ValueError("The stream ended partway through an item.")
+
+
+class MsgpackDecoder:
+    "Decode msgpack items, including numpy arrays packed by _msgpack_arrays."
+
+    def __init__(self):
+        self._unpacker = msgpack.Unpacker(ext_hook=_msgpack_arrays.ext_hook, max_buffer_size=0)
+        self._bytesize = 0
+
+    def feed(self, chunk):
+        "Add chunk to the stream, and iterate over the items it completes."
+        self._unpacker.feed(chunk)
+        self._bytesize += len(chunk)
+        return iter(self._unpacker)
+
+    def close(self):
+        "End the stream, checking that it did not end partway through an item."
+        if self._unpacker.tell() != self._bytesize:
+            raise ValueError("The stream ended partway through an item.")
+        return []
@@ -0,0 +1,87 @@
+"""
+Pack numpy arrays into msgpack as an extension type.
+
+By default, msgpack can only pack an array as a (nested) list, one boxed
+number at a time. Here, an array is packed as an ExtType whose payload is a
+small msgpack header, ``[dtype.str, shape]``, followed by the array's raw
+bytes in C order, and it is unpacked as a (writable) array copied from those
+bytes.
+
+Clients ask for this encoding of documents with the media type
+``application/x-msgpack; ext=numpy``.
+"""
+import msgpack
+import numpy
+
+MEDIA_TYPE = "application/x-msgpack; ext=numpy"
+NDARRAY_EXT_TYPE = 1
+# dtype kinds that can be sent as raw bytes: bool, int, uint, float, complex
+_RAW_KINDS = "biufc"
+
+
+def default(obj):
+    """
+    Encode numpy arrays as ExtType, for msgpack.Packer(default=...).
+
+    Arrays of other kinds (strings, objects) and numpy scalars are
+    encoded as (nested) lists and Python scalars.
+    """
+    if isinstance(obj, numpy.ndarray) and obj.dtype.kind in _RAW_KINDS:
+        array = obj if obj.flags.c_contiguous else obj.copy(order="C")
+        header = msgpack.packb([array.dtype.str, list(array.shape)])
+        buffer = array.reshape(-1).view(numpy.uint8).data
+        return msgpack.ExtType(NDARRAY_EXT_TYPE, b"".join([header, buffer]))
+    if isinstance(obj, (numpy.ndarray, numpy.generic)):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def ext_hook(code, data):
+    """
+    Decode the arrays encoded by default, for msgpack.Unpacker(ext_hook=...).
+
+    The arrays are copies of the received bytes, so that, like the arrays
+    in documents decoded from JSON, they are writable and do not keep the
+    whole message alive.
+    """
+    if code != NDARRAY_EXT_TYPE:
+        return msgpack.ExtType(code, data)
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(data)
+    dtype, shape = unpacker.unpack()
+    array = numpy.frombuffer(data, dtype=dtype, offset=unpacker.tell())
+    return array.reshape(shape).copy()
+
+
+def as_arrays(event_page):
+    """
+    Return a copy of an EventPage with its columns of numbers as arrays.
+
+    Columns of numbers (or of equally shaped arrays, once filled) can then
+    be packed as one contiguous buffer each. Other columns are unchanged.
+
+    As with numpy.asarray, a column mixing ints and floats becomes float64
+    (and one mixing bools and ints becomes int64), so its ints arrive as
+    floats. Data keys are described with one dtype per key, so the rows of
+    a column are expected to be of one type anyway.
+    """
+    return {
+        **event_page,
+        "time": _as_array(event_page["time"]),
+        "seq_num": _as_array(event_page["seq_num"]),
+        "data": {key: _as_array(column) for key, column in event_page["data"].items()},
+        "timestamps": {
+            key: _as_array(column) for key, column in event_page["timestamps"].items()
+        },
+    }
+
+
+def _as_array(column):
+    try:
+        array = numpy.asarray(column)
+    except ValueError:
+        # ragged
+        return column
+    if array.dtype.kind not in _RAW_KINDS:
+        return column
+    return array
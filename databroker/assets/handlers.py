@@ -1,5 +1,7 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
+import builtins
+import itertools
 import logging
 import numpy as np
 import os.path
@@ -52,6 +54,33 @@ class IntegrityError(Exception):
     pass
 
 
+def _consecutive_runs(numbers):
+    """
+    Split a sequence of integers into runs of consecutive, increasing values.
+
+    Returns a list of (start, stop) pairs, in order, such that concatenating
+    ``range(start, stop)`` for each pair gives back the original sequence.
+    """
+    runs = []
+    for number in numbers:
+        if runs and runs[-1][1] == number:
+            runs[-1][1] += 1
+        else:
+            runs.append([number, number + 1])
+    return [(start, stop) for start, stop in runs]
+
+
+def _squeezed_shape(shape):
+    "The shape that np.squeeze gives an array of this shape"
+    return tuple(length for length in shape if length != 1)
+
+
+def _sliced_shape(shape, slices):
+    "The shape that indexing an array of this shape by a tuple of slices gives"
+    sliced = [len(range(*s.indices(length))) for s, length in zip(slices, shape)]
+    return tuple(sliced) + tuple(shape[len(slices):])
+
+
 class AreaDetectorSPEHandler(HandlerBase):
     specs = {'AD_SPE'} | HandlerBase.specs
 
@@ -109,6 +138,16 @@ class AreaDetectorTiffHandler(HandlerBase):
                 ret.append(tif.asarray())
         return np.array(ret).squeeze()
 
+    def read_many(self, datum_kwargs_list):
+        import tifffile
+        fnames = self.get_file_list(datum_kwargs_list)
+        # One call reads the whole sequence of files into one array.
+        frames = tifffile.imread(fnames)
+        if len(fnames) == 1:
+            frames = frames[np.newaxis]
+        point_shape = _squeezed_shape((int(self._fpp), *frames.shape[1:]))
+        return frames.reshape((len(datum_kwargs_list), *point_shape))
+
     def get_file_list(self, datum_kwargs):
         ret = []
         for d_kw in datum_kwargs:
@@ -167,6 +206,33 @@ class HDF5DatasetSliceHandler(HandlerBase):
                                                           start, stop)
         return self._data_objects[point_number]
 
+    def read_many(self, datum_kwargs_list, slice=None):
+        if not self._dataset:
+            self._dataset = self._file[self._key]
+        point_numbers = [d_kw['point_number'] for d_kw in datum_kwargs_list]
+        # The slice applies to each point, of shape (fpp, *frame_shape).
+        slice = tuple(slice or ())
+        frames_slice = slice[:1] or (builtins.slice(None),)
+        frame_slice = slice[1:]
+        frame_shape = _sliced_shape(self._dataset.shape[1:], frame_slice)
+        out = np.empty((len(point_numbers),
+                        *_sliced_shape((self._fpp,), frames_slice),
+                        *frame_shape),
+                       dtype=self._dataset.dtype)
+        # Read each run of consecutive points in one hyperslab, selecting
+        # only the requested part of each frame.
+        i = 0
+        for start, stop in _consecutive_runs(point_numbers):
+            n = stop - start
+            frames = self._dataset[
+                (builtins.slice(start * self._fpp, stop * self._fpp),)
+                + frame_slice]
+            out[i:i + n] = frames.reshape(
+                (n, self._fpp, *frame_shape))[(builtins.slice(None),)
+                                              + frames_slice]
+            i += n
+        return out
+
     def open(self):
         import h5py
         if self._file:
@@ -234,6 +300,12 @@ class AreaDetectorHDF5SWMRHandler(AreaDetectorHDF5Handler):
 
         return rtn
 
+    def read_many(self, datum_kwargs_list, slice=None):
+        if self._dataset is not None:
+            self._dataset.id.refresh()
+        return super(AreaDetectorHDF5SWMRHandler, self).read_many(
+            datum_kwargs_list, slice=slice)
+
 
 class AreaDetectorHDF5TimestampHandler(HandlerBase):
     """ Handler to retrieve timestamps from Areadetector HDF5 File
@@ -444,6 +516,20 @@ class NpyFrameWise(HandlerBase):
     def __call__(self, frame_no):
         return self._data[frame_no]
 
+    def read_many(self, datum_kwargs_list, slice=None):
+        frame_nos = [d_kw['frame_no'] for d_kw in datum_kwargs_list]
+        slice = tuple(slice or ())
+        num_frames = len(self._data)
+        if not all(0 <= frame_no < num_frames for frame_no in frame_nos):
+            # Read frame by frame as __call__ does, which wraps negative
+            # frame numbers and raises IndexError for those out of range.
+            return np.stack([self(frame_no)[slice] for frame_no in frame_nos])
+        # Slice out each run of consecutive frames at once. If the file is
+        # memory-mapped, only the requested part of each frame is read.
+        return np.concatenate([
+            self._data[(builtins.slice(start, stop),) + slice]
+            for start, stop in _consecutive_runs(frame_nos)])
+
     def get_file_list(self, datum_kwarg_gen):
         return [self._fpath]
 
@@ -501,6 +587,21 @@ class PilatusCBFHandler(HandlerBase):
             ret.append(img.data)
         return np.array(ret).squeeze()
 
+    def read_many(self, datum_kwargs_list):
+        import fabio
+        file_lists = [self.get_file_list([d_kw])
+                      for d_kw in datum_kwargs_list]
+        # Each frame is a file of its own, so, unlike the frames of a
+        # (HDF5, npy) dataset, consecutive frames cannot be read together
+        # in one read. The ranges of files for neighboring points can
+        # overlap, though, so open each file only once.
+        images = {}
+        for fn in itertools.chain.from_iterable(file_lists):
+            if fn not in images:
+                images[fn] = fabio.open(fn).data
+        return np.stack([np.array([images[fn] for fn in file_list]).squeeze()
+                         for file_list in file_lists])
+
     def get_file_list(self, datum_kwargs_gen):
         file_list = []
         for dk in datum_kwargs_gen:
@@ -12,6 +12,17 @@ class HandlerBase(object):
     Base-class for Handlers to provide the boiler plate to
     make them usable in context managers by provding stubs of
     ``__enter__``, ``__exit__`` and ``close``
+
+    Handlers may optionally implement ``read_many(datum_kwargs_list)``,
+    which returns the results of calling the handler with each of the
+    given datum_kwargs, stacked into one array. Readers use it, when
+    present, to load many points with a few large reads instead of one
+    read per point.
+
+    ``read_many`` may also accept a ``slice`` keyword argument, a tuple of
+    slices to apply to the result for each datum. Handlers that can read
+    just part of each datum (e.g. a hyperslab of an HDF5 dataset) should
+    accept it; readers slice the results of other handlers themselves.
     """
     specs = set()
 
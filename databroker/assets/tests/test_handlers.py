@@ -18,6 +18,7 @@ from ..handlers import DummyAreaDetectorHandler
 from ..handlers import HDFMapsSpectrumHandler as HDFM
 from ..handlers import HDFMapsEnergyHandler as HDFE
 from ..handlers import NpyFrameWise
+from ..handlers import PilatusCBFHandler
 from ..path_only_handlers import (AreaDetectorTiffPathOnlyHandler,
                                   RawHandler)
 from numpy.testing import assert_array_equal
@@ -376,3 +377,82 @@ def test_raw_handler():
     h = RawHandler('path', a=1)
     result = h(b=2)
     assert result == ('path', {'a': 1}, {'b': 2})
+
+
+@pytest.mark.parametrize('fpp', (1, 3))
+def test_hdf5_read_many(tmpdir, fpp):
+    filename = str(tmpdir.join('data.h5'))
+    N = 8
+    with h5py.File(filename, 'w') as f:
+        data = (np.arange(N * fpp * 4 * 5).reshape(N * fpp, 4, 5))
+        f.create_dataset('/entry/data/data', data=data)
+    hand = AreaDetectorHDF5Handler(filename, frame_per_point=fpp)
+    point_numbers = [0, 1, 2, 5, 6, 3, 7]
+    datum_kwargs_list = [{'point_number': i} for i in point_numbers]
+    expected = np.stack([np.asarray(hand(**d_kw))
+                         for d_kw in datum_kwargs_list])
+    actual = hand.read_many(datum_kwargs_list)
+    assert_array_equal(actual, expected)
+    for slice_ in [(slice(None), slice(1, 3), slice(None, None, 2)),
+                   (slice(1, None),),
+                   (slice(0, 1), slice(3, 1))]:
+        actual = hand.read_many(datum_kwargs_list, slice=slice_)
+        assert_array_equal(actual, expected[(slice(None),) + slice_])
+    hand.close()
+
+
+def test_npyfw_read_many(tmpdir):
+    filename = str(tmpdir.join('data.npy'))
+    N = 15
+    np.save(filename, np.ones((N, 9, 8)) * np.arange(N).reshape(N, 1, 1))
+    hand = NpyFrameWise(filename)
+    datum_kwargs_list = [{'frame_no': i} for i in [3, 4, 5, 0, 14, 13]]
+    expected = np.stack([hand(**d_kw) for d_kw in datum_kwargs_list])
+    assert_array_equal(hand.read_many(datum_kwargs_list), expected)
+    slice_ = (slice(2, 7, 2), slice(None, 3))
+    assert_array_equal(hand.read_many(datum_kwargs_list, slice=slice_),
+                       expected[(slice(None),) + slice_])
+    # Negative frame numbers wrap, as in __call__.
+    assert_array_equal(hand.read_many([{'frame_no': -1}, {'frame_no': 0}]),
+                       np.stack([hand(frame_no=14), hand(frame_no=0)]))
+    # Frame numbers out of range raise, as in __call__.
+    with pytest.raises(IndexError):
+        hand.read_many([{'frame_no': 13}, {'frame_no': 14}, {'frame_no': 15}])
+
+
+@pytest.mark.parametrize('fpp', (1, 2))
+def test_tiff_read_many(tmpdir, fpp):
+    path = str(tmpdir) + '/'
+    template = '%s%s_%05d.tiff'
+    for j in range(6 * fpp):
+        tifffile.imwrite(template % (path, 'tiff', j),
+                         np.ones((10, 15)) * j)
+    hand = AreaDetectorTiffHandler(path, template, 'tiff', fpp)
+    datum_kwargs_list = [{'point_number': i} for i in [0, 1, 2, 5, 4]]
+    expected = np.stack([hand(**d_kw) for d_kw in datum_kwargs_list])
+    assert_array_equal(hand.read_many(datum_kwargs_list), expected)
+    # just one file
+    assert_array_equal(hand.read_many([{'point_number': 1}]),
+                       hand(point_number=1)[np.newaxis])
+
+
+@pytest.mark.parametrize('fpp', (1, 2))
+def test_cbf_read_many(tmpdir, monkeypatch, fpp):
+    fabio = pytest.importorskip('fabio')
+    from fabio.cbfimage import CbfImage
+    path = str(tmpdir)
+    template = '%s%s_%05d.cbf'
+    for j in range(8 * fpp):
+        CbfImage(data=np.ones((10, 15), dtype=np.int32) * j).write(
+            template % (os.path.join(path, ''), 'cbf', j))
+    hand = PilatusCBFHandler(path, template, 'cbf', fpp)
+    datum_kwargs_list = [{'point_number': i} for i in [0, 1, 2, 5, 4]]
+    expected = np.stack([hand(**d_kw) for d_kw in datum_kwargs_list])
+    opened = []
+    open_ = fabio.open
+    monkeypatch.setattr(fabio, 'open', lambda fn: opened.append(fn) or open_(fn))
+    assert_array_equal(hand.read_many(datum_kwargs_list), expected)
+    # Each file is opened once, though the files of neighboring points can
+    # overlap.
+    assert len(opened) == len(set(opened))
+    assert set(opened) == set(hand.get_file_list(datum_kwargs_list))
@@ -1,19 +1,33 @@
 import collections.abc
+import hashlib
 import json
 import keyword
 import numbers
+import os
+from pathlib import Path
+import tempfile
 import warnings
 
+import msgpack
 from tiled.adapters.utils import IndexCallable
 from tiled.client.container import DEFAULT_STRUCTURE_CLIENT_DISPATCH, Container
-from tiled.client.utils import handle_error
+from tiled.client.utils import MSGPACK_MIME_TYPE, ClientError, client_for_item, handle_error
 from tiled.utils import safe_json_dump
 
+from . import _compression, _framing, _msgpack_arrays
 from .common import BlueskyEventStreamMixin, BlueskyRunMixin, CatalogOfBlueskyRunsMixin
 from .queries import PartialUID, RawMongo, ScanID
 from .document import Start, Stop, Descriptor, EventPage, DatumPage, Resource
 
 
+# If set, keep a copy of the documents of each completed run streamed by
+# BlueskyRun.documents in this directory, and stream them from there next time.
+DOCUMENT_CACHE_DIR = os.getenv("DATABROKER_DOCUMENT_CACHE_DIR")
+# File suffix of cached document streams, by media type
+_CACHE_SUFFIXES = {
+    _msgpack_arrays.MEDIA_TYPE: ".msgpack",
+    "application/json-seq": ".jsonseq",
+}
 _document_types = {
     "start": Start,
     "stop": Stop,
@@ -60,7 +74,29 @@ class BlueskyRun(BlueskyRunMixin, Container):
     def v2(self):
         return self
 
-    def documents(self, fill=False):
+    def documents(self, fill=False, stream_names=None, fields=None, resume_after=None):
+        """
+        Yield the (name, document) pairs of this run.
+
+        Parameters
+        ----------
+        fill : bool, optional
+            Whether to load external data into the Events.
+        stream_names : list of str, optional
+            Include only the Events of these streams.
+        fields : list of str, optional
+            Include only these fields of the Events.
+        resume_after : dict, optional
+            Map stream name to the last seq_num already received, to skip
+            the Events up to and including it, e.g. to resume an
+            interrupted transfer.
+
+        If DOCUMENT_CACHE_DIR (from the environment variable
+        DATABROKER_DOCUMENT_CACHE_DIR) is set, the documents of a completed
+        run are kept there as they arrive, and served from there, without
+        contacting the server, the next time they are requested. A run with
+        no Stop document is always streamed from the server.
+        """
         # For back-compat with v2:
         if fill == "yes":
             fill = True
@@ -73,25 +109,68 @@ class BlueskyRun(BlueskyRunMixin, Container):
         link = self.item["links"]["self"].replace(
             "/metadata", "/documents", 1
         )
+        params = {"fill": fill}
+        if stream_names is not None:
+            params["stream"] = list(stream_names)
+        if fields is not None:
+            params["field"] = list(fields)
+        if resume_after:
+            params["resume_after"] = [
+                f"{stream_name}:{seq_num}" for stream_name, seq_num in resume_after.items()
+            ]
+        cache_path = self._document_cache_path(params)
+        if cache_path is not None:
+            for media_type, suffix in _CACHE_SUFFIXES.items():
+                try:
+                    file = open(cache_path.with_suffix(suffix), "rb")
+                except FileNotFoundError:
+                    continue
+                with file:
+                    yield from _decode_documents(
+                        iter(lambda: file.read(1_000_000), b""), media_type
+                    )
+                return
         with self.context.http_client.stream(
-            "GET", link, params={"fill": fill},
-            headers={"Accept": "application/json-seq"}
+            "GET", link, params=params,
+            headers={
+                # Prefer msgpack with numpy arrays sent as raw buffers.
+                "Accept": f"{_msgpack_arrays.MEDIA_TYPE}, application/json-seq",
+                "Accept-Encoding": ", ".join(_compression.ENCODINGS),
+            },
         ) as response:
             if response.is_error:
                 response.read()
                 handle_error(response)
-            tail = ""
-            for chunk in response.iter_bytes():
-                for line in chunk.decode().splitlines(keepends=True):
-                    if line[-1] == "\n":
-                        item = json.loads(tail + line)
-                        yield (item["name"], _document_types[item["name"]](item["doc"]))
-                        tail = ""
-                    else:
-                        tail += line
-            if tail:
-                item = json.loads(tail)
-                yield (item["name"], _document_types[item["name"]](item["doc"]))
+            # Decode the compression here, rather than leave it to httpx,
+            # because the server compresses each chunk of the stream
+            # separately, e.g. as a new zstd frame, and not every version of
+            # httpx can decode more than one frame.
+            chunks = _compression.decompress(
+                response.iter_raw(), response.headers.get("Content-Encoding")
+            )
+            media_type = response.headers["Content-Type"]
+            if (cache_path is None) or (media_type not in _CACHE_SUFFIXES):
+                yield from _decode_documents(chunks, media_type)
+                return
+            with _CacheFile(cache_path.with_suffix(_CACHE_SUFFIXES[media_type])) as cache_file:
+                yield from _decode_documents(cache_file.tee(chunks), media_type)
+                cache_file.commit()
+
+    def _document_cache_path(self, params):
+        """
+        Return the path, less suffix, at which to cache the documents for
+        these query parameters, or None if they should not be cached.
+        """
+        if DOCUMENT_CACHE_DIR is None:
+            return None
+        stop = self.metadata["stop"]
+        if stop is None:
+            # The run may not be done.
+            return None
+        key = json.dumps(
+            [self.item["links"]["self"], stop["uid"], stop["time"], params], sort_keys=True
+        )
+        return Path(DOCUMENT_CACHE_DIR, self.start["uid"], hashlib.sha256(key.encode()).hexdigest())
 
     def __getattr__(self, key):
         """
@@ -218,6 +297,52 @@ and then read() will return dask objects.""",
         ).read()
 
 
+def _decode_documents(chunks, media_type):
+    "Decode (name, doc) pairs, wrapping each one only as the caller asks for it."
+    if media_type == _msgpack_arrays.MEDIA_TYPE:
+        decoder = _framing.MsgpackDecoder()
+    else:
+        decoder = _framing.JSONSeqDecoder()
+    for chunk in chunks:
+        for item in decoder.feed(chunk):
+            yield (item["name"], _document_types[item["name"]](item["doc"]))
+    for item in decoder.close():
+        yield (item["name"], _document_types[item["name"]](item["doc"]))
+
+
+class _CacheFile:
+    """
+    Write a stream of bytes to a file, which appears at path only once
+    committed, so that an interrupted stream is never cached.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+
+    def __enter__(self):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(
+            dir=self._path.parent, suffix=".partial", delete=False
+        )
+        return self
+
+    def tee(self, chunks):
+        "Write each chunk to the file as it passes through."
+        for chunk in chunks:
+            self._file.write(chunk)
+            yield chunk
+
+    def commit(self):
+        self._file.close()
+        os.replace(self._file.name, self._path)
+
+    def __exit__(self, *exc_info):
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self._file.name)
+
+
 class CatalogOfBlueskyRuns(CatalogOfBlueskyRunsMixin, Container):
     """
     This adds some bluesky-specific conveniences to the standard client Container.
@@ -271,8 +396,7 @@ class CatalogOfBlueskyRuns(CatalogOfBlueskyRunsMixin, Container):
             return self.values()[key]
         elif isinstance(key, collections.abc.Iterable):
             # We know that isn't a str because we check that above.
-            # Recurse.
-            return [self[item] for item in key]
+            return self._lookup_many(key)
         else:
             raise ValueError(
                 "Indexing expects a string, an integer, or a collection of strings and/or integers."
@@ -286,6 +410,71 @@ class CatalogOfBlueskyRuns(CatalogOfBlueskyRunsMixin, Container):
             # By construction there must be only one result. Return it.
             return results.values().first()
 
+    def _lookup_many(self, keys):
+        """
+        Look up a list of keys, as __getitem__ does for each one.
+
+        The scan_ids, uids, and partial uids among them are looked up together
+        in one request. Any other keys are looked up one at a time.
+        """
+        keys = list(keys)
+        if any(isinstance(key, bool) for key in keys):
+            # bool is an Integral, but True is surely not meant as scan_id 1.
+            raise ValueError(
+                "Indexing expects a string, an integer, or a collection of strings and/or integers."
+            )
+        batched = [
+            isinstance(key, str) or (isinstance(key, numbers.Integral) and key > 0)
+            for key in keys
+        ]
+        batch = {}
+        for key, is_batched in zip(keys, batched):
+            if is_batched:
+                batch[key] = key if isinstance(key, str) else int(key)
+        items = {}
+        if batch:
+            link = self.item["links"]["self"].replace("/metadata", "/runs/lookup", 1)
+            params = dict(self._queries_as_params)
+            if self._include_data_sources:
+                params["include_data_sources"] = True
+            try:
+                content = handle_error(
+                    self.context.http_client.post(
+                        link,
+                        headers={"Accept": MSGPACK_MIME_TYPE},
+                        params=params,
+                        content=safe_json_dump({"keys": list(batch.values())}),
+                    )
+                ).json()
+            except ClientError as err:
+                if err.response.status_code != 404:
+                    raise
+                # This server (or this search) does not support batch
+                # lookup. Fall back to looking up keys one at a time.
+                return [self[key] for key in keys]
+            items = dict(zip(batch, content["data"]))
+        results = []
+        for key, is_batched in zip(keys, batched):
+            if not is_batched:
+                results.append(self[key])
+                continue
+            item = items[key]
+            if item is None:
+                if not isinstance(key, str):
+                    raise KeyError(f"No match for scan_id={key}")
+                if len(key) == 36:
+                    raise KeyError(f"No match for uid {key}")
+                raise KeyError(f"No match for partial_uid {key}")
+            results.append(
+                client_for_item(
+                    self.context,
+                    self.structure_clients,
+                    item,
+                    include_data_sources=self._include_data_sources,
+                )
+            )
+        return results
+
     def _lookup_by_partial_uid(self, partial_uid):
         results = self.search(PartialUID(partial_uid))
         if not results:
@@ -327,3 +516,36 @@ class CatalogOfBlueskyRuns(CatalogOfBlueskyRunsMixin, Container):
             content=safe_json_dump({"name": name, "doc": doc})
         )
         handle_error(response)
+
+    def post_documents(self, documents):
+        """
+        Insert many documents in one request.
+
+        Parameters
+        ----------
+        documents : iterable
+            (name, doc) pairs, e.g. from ``run.documents()``. EventPages and
+            DatumPages are inserted much more efficiently than the equivalent
+            Events and Datums one by one.
+
+        Returns
+        -------
+        count : int
+            The number of documents inserted
+        """
+        link = self.item["links"]["self"].replace(
+            "/metadata", "/documents/bulk", 1
+        )
+
+        def content():
+            packer = msgpack.Packer(default=_msgpack_arrays.default)
+            for name, doc in documents:
+                yield packer.pack({"name": name, "doc": doc})
+
+        response = self.context.http_client.post(
+            link,
+            content=content(),
+            headers={"Content-Type": _msgpack_arrays.MEDIA_TYPE},
+        )
+        handle_error(response)
+        return response.json()["documents"]
@@ -1,16 +1,25 @@
+import bisect
 import builtins
 import collections
 import collections.abc
+import concurrent.futures
 import copy
 from datetime import datetime, timedelta
 import functools
+import heapq
+import inspect
 import itertools
 import logging
 import os
+import queue
+import re
 import sys
 import threading
+import time
 
+import bson
 from bson.objectid import ObjectId, InvalidId
+from bson.raw_bson import RawBSONDocument
 import cachetools
 import entrypoints
 import event_model
@@ -35,7 +44,17 @@ from tiled.structures.array import (
 from tiled.adapters.mapping import MapAdapter
 from tiled.iterviews import KeysView, ItemsView, ValuesView
 from tiled.query_registration import QueryTranslationRegistry
-from tiled.queries import Contains, Comparison, Eq, FullText, In, NotEq, NotIn, Regex
+from tiled.queries import (
+    Contains,
+    Comparison,
+    Eq,
+    FullText,
+    In,
+    NotEq,
+    NotIn,
+    QueryValueError,
+    Regex,
+)
 from tiled.adapters.utils import (
     tree_repr,
     IndexersMixin,
@@ -43,6 +62,7 @@ from tiled.adapters.utils import (
 from tiled.structures.core import Spec, StructureFamily
 from tiled.utils import import_object, OneShotCachedMap, UNCHANGED
 
+from ._bson_columns import ARRAY, decode_array, field_offsets
 from .common import BlueskyEventStreamMixin, BlueskyRunMixin, CatalogOfBlueskyRunsMixin
 from .queries import (
     BlueskyMapAdapter,
@@ -67,6 +87,23 @@ from .server import router
 
 CHUNK_SIZE_LIMIT = os.getenv("DATABROKER_CHUNK_SIZE_LIMIT", "100MB")
 MAX_AD_FRAMES_PER_CHUNK = int(os.getenv("DATABROKER_MAX_AD_FRAMES_PER_CHUNK", "10"))
+# Number of documents to fill ahead of the one being sent in
+# BlueskyRun.documents(fill=True)
+FILL_PREFETCH_DEPTH = int(os.getenv("DATABROKER_FILL_PREFETCH_DEPTH", "4"))
+# Aim for 10 MB pages to stay safely clear the MongoDB's hard limit
+# of 16 MB.
+TARGET_PAGE_BYTESIZE = 10_000_000
+# Number of Events per Event Descriptor to inspect when measuring how many
+# bytes each field contributes to a page.
+ROW_BYTESIZE_SAMPLE_SIZE = 5
+# MongoDB reports this error code when a page turns out to exceed 16 MB.
+BSON_OBJECT_TOO_LARGE = 10334
+# Aim for EventPages of about 1 MB in BlueskyRun.documents, so that the
+# first page reaches the client quickly.
+TARGET_EVENT_PAGE_BYTESIZE = 1_000_000
+# Number of Run Start documents to fetch from MongoDB at a time when listing
+# runs. The BlueskyRuns for each batch are made together.
+CURSOR_LIMIT = 100  # TODO Tune this for performance.
 
 logger = logging.getLogger(__name__)
 
@@ -374,56 +411,200 @@ class BlueskyRun(MapAdapter, BlueskyRunMixin):
             transformed_doc = doc
         return transformed_doc
 
+    def get_datums(self, datum_ids):
+        """
+        Look up many Datum documents in one query.
+
+        Returns a dict mapping each datum_id to its Datum document.
+        """
+        unique_datum_ids = list(set(datum_ids))
+        datums = {
+            doc["datum_id"]: doc
+            for doc in self._datum_collection.find(
+                {"datum_id": {"$in": unique_datum_ids}}, {"_id": False}
+            )
+        }
+        for datum_id in unique_datum_ids:
+            if datum_id not in datums:
+                raise ValueError(f"Could not find Datum with datum_id={datum_id}")
+        return datums
+
+    def get_resources(self, uids):
+        """
+        Look up many Resource documents in one query.
+
+        Returns a dict mapping each uid to its Resource document.
+        """
+        resources = self._find_resources(uids)
+        for uid in set(uids) - resources.keys():
+            # Fall back to get_resource, which handles old Resource documents
+            # that are referenced by '_id', and raises if there is no match.
+            resources[uid] = self.get_resource(uid)
+        return resources
+
+    def _find_resources(self, uids):
+        "Return the Resource documents matching any of uids, keyed by uid."
+        resources = {}
+        if not uids:
+            return resources
+        for doc in self._resource_collection.find(
+            {"uid": {"$in": list(set(uids))}}, {"_id": False}
+        ):
+            if "resource" in self.transforms:
+                resources[doc["uid"]] = self.transforms["resource"](doc)
+            else:
+                resources[doc["uid"]] = doc
+        return resources
+
+    def _get_datums_for_resources(self, resource_uids):
+        "Return all the Datum documents of the given Resources, keyed by datum_id."
+        return {
+            doc["datum_id"]: doc
+            for doc in self._datum_collection.find(
+                {"resource": {"$in": list(resource_uids)}}, {"_id": False}
+            )
+        }
+
+    def _resolve_datums(self, datum_ids, known_resource_uids):
+        """
+        Look up the Datum documents for datum_ids and any Resource documents
+        they reference that are not in known_resource_uids.
+
+        Returns (datums, resources), keyed by datum_id and uid respectively.
+        This takes a few batched queries, however many Datums and Resources
+        there are. All the Datums of each new Resource are included, as
+        later Events are likely to need them.
+        """
+        # Fast path: a datum_id is often "{resource_uid}/{index}". Guess the
+        # Resources that way first, which saves looking up the Datums.
+        guessed_uids = {
+            datum_id.split("/", 1)[0] for datum_id in datum_ids if "/" in datum_id
+        }
+        resources = {}
+        datums = {}
+        if guessed_uids - known_resource_uids:
+            resources.update(self._find_resources(guessed_uids - known_resource_uids))
+            datums.update(self._get_datums_for_resources(resources))
+        # But the key might just happen to have a '/' in it, with no semantic
+        # meaning, so look up whatever is still missing the standard way.
+        missing = [datum_id for datum_id in datum_ids if datum_id not in datums]
+        if missing:
+            missing_datums = self.get_datums(missing)
+            datums.update(missing_datums)
+            new_resource_uids = {
+                datum["resource"] for datum in missing_datums.values()
+            } - known_resource_uids - resources.keys()
+            if new_resource_uids:
+                new_resources = self.get_resources(new_resource_uids)
+                resources.update(new_resources)
+                for datum_id, datum in self._get_datums_for_resources(new_resources).items():
+                    datums.setdefault(datum_id, datum)
+        return datums, resources
+
+    def get_handler(self, resource):
+        "Return a handler instance for this Resource, reusing one if possible."
+        return self.filler._get_handler_maybe_cached(resource)
+
     def lookup_resource_for_datum(self, datum_id):
         doc = self._datum_collection.find_one({"datum_id": datum_id})
         if doc is None:
             raise ValueError(f"Could not find Datum with datum_id={datum_id}")
         return doc["resource"]
 
-    def single_documents(self, fill):
+    def single_documents(self, fill, size=None):
+        """
+        Yield ``(name, document)`` items from the run, as documents() does,
+        but with each EventPage and DatumPage unpacked into Events and Datums.
+        """
+        for name, doc in self.documents(fill=fill, size=size):
+            if name == "event_page":
+                for event in event_model.unpack_event_page(doc):
+                    yield ("event", event)
+            elif name == "datum_page":
+                for datum in event_model.unpack_datum_page(doc):
+                    yield ("datum", datum)
+            else:
+                yield name, doc
+
+    def documents(self, fill, size=None, stream_names=None, fields=None, resume_after=None):
+        """
+        Yield ``(name, document)`` items from the run.
+
+        Events are read from MongoDB in pages, column by column, and yielded
+        as EventPages of about TARGET_EVENT_PAGE_BYTESIZE, or at most
+        ``size`` rows if given. Pages are split where the streams interleave
+        in time, to preserve time-ordering. Each EventPage is preceded by
+        the Resource and Datum (as DatumPage) documents it references that
+        have not been yielded yet.
+
+        If fill is true, the external data is loaded into the EventPages
+        using this run's filler. The next FILL_PREFETCH_DEPTH documents are
+        prepared in a background thread while the caller handles the
+        current one.
+
+        The documents may be narrowed down, in the queries to MongoDB:
+
+        stream_names: list of str, optional
+            Include only the Events of these streams.
+        fields: list of str, optional
+            Include only these fields ("data keys") of the Events, and trim
+            the Event Descriptors to match.
+        resume_after: dict, optional
+            Map stream name to the last seq_num already received, to skip
+            the Events up to and including it. The start, stop and Event
+            Descriptor documents are always included.
+        """
+        if stream_names is None:
+            streams = list(self.values())
+        else:
+            streams = [self[stream_name] for stream_name in stream_names]
+        if resume_after is None:
+            resume_after = {}
+        documents = self._documents(
+            fill=fill,
+            size=size,
+            streams=streams,
+            fields=fields,
+            resume_after=resume_after,
+        )
         if fill:
-            raise NotImplementedError("Only fill=False is implemented.")
+            yield from _prefetch(documents, FILL_PREFETCH_DEPTH)
+        else:
+            yield from documents
+
+    def _documents(self, fill, size, streams, fields, resume_after):
         external_fields = {}  # map descriptor uid to set of external fields
-        datum_cache = {}  # map datum_id to datum document
         # Track which Resource and Datum documents we have yielded so far.
         resource_uids = set()
         datum_ids = set()
-        # Interleave the documents from the streams in time order.
-        merged_iter = toolz.itertoolz.merge_sorted(
-            *(stream.iter_descriptors_and_events() for stream in self.values()),
-            key=lambda item: item[1]["time"],
-        )
+        # Hold the Datum and Resource documents looked up ahead of the
+        # EventPages that need them.
+        datum_cache = {}  # map datum_id to datum document
+        resource_cache = {}  # map uid to resource document
         yield ("start", self.metadata()["start"])
-        for name, doc in merged_iter:
-            # Insert Datum, Resource as needed, and then yield (name, doc).
-            if name == "event":
-                for field in external_fields[doc["descriptor"]]:
-                    datum_id = doc["data"][field]
-                    if datum_ids not in datum_ids:
-                        # We haven't yielded this Datum yet. Look it up, and yield it.
-                        try:
-                            # Check to see if it's been pre-fetched.
-                            datum = datum_cache.pop(datum_id)
-                        except KeyError:
-                            resource_uid = self.lookup_resource_for_datum(datum_id)
-                            if resource_uid not in resource_uids:
-                                # We haven't yielded this Resource yet. Look it up, and yield it.
-                                resource = self.get_resource(resource_uid)
-                                resource_uids.add(resource_uid)
-                                yield ("resource", resource)
-                                # Pre-fetch *all* the Datum documents for this resource in one query.
-                                datum_cache.update(
-                                    {
-                                        doc["datum_id"]: doc
-                                        for doc in self.get_datum_for_resource(
-                                            resource_uid
-                                        )
-                                    }
-                                )
-                                # Now get the Datum we originally were looking for.
-                                datum = datum_cache.pop(datum_id)
-                            datum_ids.add(datum_id)
-                        yield ("datum", datum)
+        for name, doc in _merge_event_pages(
+            *(
+                stream.iter_descriptors_and_event_pages(
+                    size,
+                    fill=fill,
+                    fields=fields,
+                    # seq_num counts up per stream, across its Descriptors.
+                    min_seq_num=resume_after[stream.key] + 1 if stream.key in resume_after else 0,
+                )
+                for stream in streams
+            )
+        ):
+            if name == "event_page":
+                yield from self._resources_and_datums(
+                    doc,
+                    external_fields[doc["descriptor"]],
+                    resource_uids,
+                    datum_ids,
+                    datum_cache,
+                    resource_cache,
+                )
+                if fill:
+                    doc = self._fill_event_page(doc, external_fields[doc["descriptor"]])
             elif name == "descriptor":
                 # Track which fields ("data keys") hold references to external data.
                 external_fields[doc["uid"]] = {
@@ -436,14 +617,86 @@ class BlueskyRun(MapAdapter, BlueskyRunMixin):
         if stop_doc is not None:
             yield ("stop", stop_doc)
 
-    def documents(self, fill, size=25):
+    def _resources_and_datums(
+        self, event_page, external_fields, resource_uids, datum_ids, datum_cache, resource_cache
+    ):
         """
-        Yield ``(name, document)`` items from the run.
+        Yield the Resource and DatumPage documents that event_page needs,
+        except for those already yielded, and record them as yielded.
 
-        Batch Event and Datum documents into pages of up to ``size`` rows,
-        while preserving time-ordering.
+        The Datums not in datum_cache are looked up by _resolve_datums, which
+        also fetches all the Datums of any Resource new to it. Those are held
+        in datum_cache (and the Resources in resource_cache) for the
+        EventPages to come, which then usually need no queries at all.
         """
-        yield from batch_documents(self.single_documents(fill=fill), size)
+        new_datum_ids = list(
+            dict.fromkeys(
+                datum_id
+                for field in sorted(external_fields)
+                for datum_id in event_page["data"][field]
+                if datum_id not in datum_ids
+            )
+        )
+        if not new_datum_ids:
+            return
+        unresolved = [datum_id for datum_id in new_datum_ids if datum_id not in datum_cache]
+        if unresolved:
+            datums, resources = self._resolve_datums(
+                unresolved, resource_uids | resource_cache.keys()
+            )
+            for datum_id, datum in datums.items():
+                if datum_id not in datum_ids:
+                    datum_cache.setdefault(datum_id, datum)
+            resource_cache.update(resources)
+        datums_by_resource = collections.defaultdict(list)
+        for datum_id in new_datum_ids:
+            datum = datum_cache.pop(datum_id)
+            datums_by_resource[datum["resource"]].append(datum)
+        for resource_uid, resource_datums in datums_by_resource.items():
+            if resource_uid not in resource_uids:
+                resource_uids.add(resource_uid)
+                yield ("resource", resource_cache.pop(resource_uid))
+            yield ("datum_page", event_model.pack_datum_page(*resource_datums))
+        datum_ids.update(new_datum_ids)
+
+    def _fill_event_page(self, event_page, external_fields):
+        """
+        Return a copy of event_page with its external data loaded.
+
+        As with event_model.Filler, the rows of each field marked as not
+        filled are replaced by the data, and marked as filled with their
+        datum_id. Rows are read in batches, one per Resource, with the
+        filler's (cached) handlers.
+        """
+        data = dict(event_page["data"])
+        filled = dict(event_page["filled"])
+        retry_intervals = self.filler.retry_intervals
+        for field in sorted(external_fields):
+            column = data[field]
+            rows = [
+                row for row, is_filled in enumerate(filled.get(field, [])) if is_filled is False
+            ]
+            if not rows:
+                continue
+            datums = self.get_datums([column[row] for row in rows])
+            rows_by_resource = collections.defaultdict(list)
+            for row in rows:
+                rows_by_resource[datums[column[row]]["resource"]].append(row)
+            column = list(column)
+            filled[field] = list(filled[field])
+            for resource_uid, resource_rows in rows_by_resource.items():
+                resource = self.get_resource(resource_uid)
+                values = _read_datums(
+                    self.get_handler(resource),
+                    resource,
+                    [datums[column[row]] for row in resource_rows],
+                    retry_intervals,
+                )
+                for row, value in zip(resource_rows, values):
+                    filled[field][row] = column[row]
+                    column[row] = numpy.asarray(value)
+            data[field] = column
+        return {**event_page, "data": data, "filled": filled}
 
 
 class BlueskyEventStream(MapAdapter, BlueskyEventStreamMixin):
@@ -455,6 +708,7 @@ class BlueskyEventStream(MapAdapter, BlueskyEventStreamMixin):
         event_collection,
         cutoff_seq_num,
         run,
+        row_bytesizes=None,
         specs=None,
         **kwargs,
     ):
@@ -468,6 +722,9 @@ class BlueskyEventStream(MapAdapter, BlueskyEventStreamMixin):
         self._event_collection = event_collection
         self._cutoff_seq_num = cutoff_seq_num
         self._run = run
+        if row_bytesizes is None:
+            row_bytesizes = {}
+        self.row_bytesizes = row_bytesizes
 
     @property
     def must_revalidate(self):
@@ -517,27 +774,182 @@ class BlueskyEventStream(MapAdapter, BlueskyEventStreamMixin):
             event_collection=self._event_collection,
             cutoff_seq_num=self._cutoff_seq_num,
             run=self._run,
+            row_bytesizes=self.row_bytesizes,
             **kwargs,
         )
 
-    def iter_descriptors_and_events(self):
+    def iter_descriptors_and_events(self, size=None):
+        """
+        Yield each Event Descriptor, followed by its Events in time order.
+
+        The Events are unpacked from the EventPages that
+        iter_descriptors_and_event_pages yields, so only one page is held in
+        memory at a time.
+        """
+        for name, doc in self.iter_descriptors_and_event_pages(size):
+            if name == "event_page":
+                for event in event_model.unpack_event_page(doc):
+                    yield ("event", event)
+            else:
+                yield name, doc
+
+    def iter_descriptors_and_event_pages(self, size=None, fill=False, fields=None, min_seq_num=0):
+        """
+        Yield each Event Descriptor, followed by its Events as EventPages.
+
+        Each EventPage is built column by column, by one aggregation over a
+        range of seq_nums expected to hold about TARGET_EVENT_PAGE_BYTESIZE
+        of Events (and at most ``size`` rows, if given). If fill is true,
+        the size of the external data, once it is filled in, is counted too.
+        Within a page, the Events are sorted by time.
+
+        If fields is given, only those fields of the Events are read, and
+        the Descriptors are trimmed to match. Events with seq_num less than
+        min_seq_num are skipped.
+        """
         for descriptor in sorted(
             self.metadata()["descriptors"], key=lambda d: d["time"]
         ):
+            if fields is not None:
+                descriptor = _select_descriptor_fields(descriptor, fields)
             yield ("descriptor", descriptor)
-            # TODO Grab paginated chunks.
-            events = list(
-                self._event_collection.find(
-                    {
-                        "descriptor": descriptor["uid"],
-                        "seq_num": {"$lte": self._cutoff_seq_num},
+            num_seq_nums = self._event_page_num_seq_nums(descriptor, fill)
+            if size is not None:
+                num_seq_nums = min(num_seq_nums, size)
+            for event_page in self._iter_pages(
+                descriptor["uid"],
+                num_seq_nums,
+                lambda min_seq_num, max_seq_num: self._fetch_event_pages(
+                    descriptor, min_seq_num, max_seq_num
+                ),
+                min_seq_num=min_seq_num,
+            ):
+                yield ("event_page", event_page)
+
+    def _iter_pages(self, descriptor_uid, num_seq_nums, fetch, min_seq_num=0):
+        """
+        Call fetch(min_seq_num, max_seq_num) on successive ranges of
+        num_seq_nums seq_nums of this Descriptor's Events, from min_seq_num
+        up to the cutoff, and yield the items in the lists it returns.
+        """
+        min_seq_num = self._first_seq_num(descriptor_uid, min_seq_num)
+        while (min_seq_num is not None) and (min_seq_num <= self._cutoff_seq_num):
+            max_seq_num = min(min_seq_num + num_seq_nums, self._cutoff_seq_num + 1)
+            items = fetch(min_seq_num, max_seq_num)
+            yield from items
+            if items:
+                min_seq_num = max_seq_num
+            else:
+                # Skip over a gap in the seq_nums in one step.
+                min_seq_num = self._first_seq_num(descriptor_uid, max_seq_num)
+
+    def _event_page_num_seq_nums(self, descriptor, fill):
+        "Number of seq_nums to put in each EventPage, based on a sample of Events"
+        sample = self._event_collection.find(
+            {"descriptor": descriptor["uid"]}, {"_id": False}, limit=ROW_BYTESIZE_SAMPLE_SIZE
+        )
+        event_bytesize = max((len(bson.encode(event)) for event in sample), default=1)
+        if fill:
+            for data_key in descriptor["data_keys"].values():
+                if "external" in data_key:
+                    dtype = _numeric_dtype(data_key)
+                    itemsize = 8 if dtype is None else dtype.itemsize
+                    event_bytesize += int(numpy.prod(data_key["shape"] or [])) * itemsize
+        return max(1, TARGET_EVENT_PAGE_BYTESIZE // event_bytesize)
+
+    def _fetch_event_pages(self, descriptor, min_seq_num, max_seq_num):
+        """
+        Build an EventPage from the Events in a range of seq_nums.
+
+        Returns a list of EventPages: empty if there are no Events in the
+        range, or more than one if the page had to be split.
+        """
+        match = {
+            "descriptor": descriptor["uid"],
+            "seq_num": {"$gte": min_seq_num, "$lt": max_seq_num},
+        }
+        keys = list(descriptor["data_keys"])
+        # Keys can contain "." so they cannot name fields in $group.
+        aliases = {key: f"_{i}" for i, key in enumerate(keys)}
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"time": 1}},
+            {
+                "$group": {
+                    "_id": None,
+                    "uid": {"$push": "$uid"},
+                    "time": {"$push": "$time"},
+                    "seq_num": {"$push": "$seq_num"},
+                    "filled": {"$push": {"$ifNull": ["$filled", {}]}},
+                    **{f"data{aliases[key]}": {"$push": f"$data.{key}"} for key in keys},
+                    **{
+                        f"timestamps{aliases[key]}": {"$push": f"$timestamps.{key}"}
+                        for key in keys
                     },
-                    {"_id": False},
-                    sort=[("time", pymongo.ASCENDING)],
-                )
+                },
+            },
+        ]
+        try:
+            results = list(self._event_collection.aggregate(pipeline))
+        except pymongo.errors.OperationFailure as err:
+            if (err.code != BSON_OBJECT_TOO_LARGE) or (max_seq_num - min_seq_num < 2):
+                raise
+            # The Events were larger than the sample suggested. Split the page.
+            middle = (min_seq_num + max_seq_num) // 2
+            return [
+                *self._fetch_event_pages(descriptor, min_seq_num, middle),
+                *self._fetch_event_pages(descriptor, middle, max_seq_num),
+            ]
+        if not results:
+            return []
+        (result,) = results
+        num_rows = len(result["uid"])
+        if not num_rows:
+            # (mongomock returns a group even if no Events matched.)
+            return []
+        if any(
+            len(result[f"{sub_dict}{alias}"]) != num_rows
+            for alias in aliases.values()
+            for sub_dict in ("data", "timestamps")
+        ):
+            # Some Events are missing some keys, and $push skips missing
+            # values, so the columns do not line up. Pack whole Events.
+            events = self._event_collection.find(
+                match, {"_id": False}, sort=[("time", pymongo.ASCENDING)]
             )
-            for event in events:
-                yield ("event", event)
+            # (Keys can contain "." so they cannot be selected by projection.)
+            return [
+                event_model.pack_event_page(
+                    *(_select_event_fields(event, keys) for event in events)
+                )
+            ]
+        filled = {}
+        for row in result["filled"]:
+            for key, value in row.items():
+                if key in aliases:
+                    filled.setdefault(key, []).append(value)
+        return [
+            {
+                "time": result["time"],
+                "uid": result["uid"],
+                "seq_num": result["seq_num"],
+                "descriptor": descriptor["uid"],
+                "filled": filled,
+                "data": {key: result[f"data{aliases[key]}"] for key in keys},
+                "timestamps": {key: result[f"timestamps{aliases[key]}"] for key in keys},
+            }
+        ]
+
+    def _first_seq_num(self, descriptor_uid, min_seq_num):
+        "Return the lowest seq_num >= min_seq_num for this Descriptor, or None."
+        event = self._event_collection.find_one(
+            {"descriptor": descriptor_uid, "seq_num": {"$gte": min_seq_num}},
+            {"_id": False, "seq_num": True},
+            sort=[("seq_num", pymongo.ASCENDING)],
+        )
+        if event is None:
+            return None
+        return event["seq_num"]
 
 
 class ArrayFromDocuments:
@@ -569,6 +981,59 @@ class ArrayFromDocuments:
         return self._dataset_adapter.array_structures[self._field]
 
 
+class ColumnCache(cachetools.LRUCache):
+    """
+    An LRU cache of columns (numpy arrays) bounded by their total size in bytes
+
+    This holds columns read from completed runs, which cannot change. It is
+    shared by all the runs of a MongoAdapter. It counts hits, misses, and
+    evictions, for monitoring.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum total size of the cached arrays, in bytes
+    """
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize=maxsize, getsizeof=lambda array: array.nbytes)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return (
+            f"<{type(self).__name__} {self.currsize}/{self.maxsize} bytes "
+            f"hits={self.hits} misses={self.misses} evictions={self.evictions}>"
+        )
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+    def get_column(self, key):
+        "Return the cached column for this key, or None."
+        with self._lock:
+            try:
+                array = self[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return array
+
+    def put_column(self, key, array):
+        "Cache a column, unless it alone is larger than the whole cache."
+        if array.nbytes > self.maxsize:
+            return
+        # Cached columns are shared by every reader, so protect them.
+        array.flags.writeable = False
+        with self._lock:
+            self[key] = array
+
+
 class DatasetFromDocuments:
     """
     An xarray.Dataset from a sub-dict of an Event stream
@@ -588,15 +1053,33 @@ class DatasetFromDocuments:
         root_map,
         sub_dict,
         validate_shape,
+        row_bytesizes,
+        page_fetch_concurrency=1,
+        fill_concurrency=1,
+        column_cache=None,
+        has_duplicate_seq_nums=True,
     ):
         self._run = run
         self._stream_name = stream_name
         self._cutoff_seq_num = cutoff_seq_num
         self._event_descriptors = event_descriptors
         self._event_collection = event_collection
+        # Where supported, column pages are read as raw BSON so that columns
+        # of numbers can be decoded straight into numpy arrays.
+        self._raw_event_collection = _raw_bson_collection(event_collection)
         self._sub_dict = sub_dict
         self.root_map = root_map
         self.validate_shape = validate_shape
+        # This dict is shared with the BlueskyEventStream and the other
+        # DatasetFromDocuments in the stream. It maps field paths like
+        # "data.x" to the measured number of bytes a row adds to a page.
+        self._row_bytesizes = row_bytesizes
+        self._page_fetch_concurrency = page_fetch_concurrency
+        self._fill_concurrency = fill_concurrency
+        self._column_cache = column_cache
+        # Whether any seq_num may be repeated, in which case only the latest
+        # Event with that seq_num is used
+        self._has_duplicate_seq_nums = has_duplicate_seq_nums
 
         # metadata should look like
         # {
@@ -700,14 +1183,9 @@ class DatasetFromDocuments:
             keys_to_fetch = list(self.array_structures)
         else:
             keys_to_fetch = list(fields)
-        columns = {}
-        # Since "time" come from a different place in a Event schema,
-        # it is handled specially.
-        if "time" in keys_to_fetch:
-            keys_to_fetch.remove("time")
-            columns["time"] = self._get_time_coord(slice_params=None)
-        if keys_to_fetch:
-            columns.update(self.get_columns(keys_to_fetch, slices=None))
+        # "time" comes from a different place in the Event schema, but it
+        # is fetched in the same pipelines as the other columns.
+        columns = self.get_columns(keys_to_fetch, slices=None)
         mapping = {}
         for key, structure in self.array_structures.items():
             if (fields is not None) and (key not in fields):
@@ -759,6 +1237,15 @@ class DatasetFromDocuments:
             for starts, shapes in zip(cumdims, chunks)
         ]
         slices = [s[index] for s, index in zip(slices_for_chunks, block)]
+        # Read only the requested part of each row, where we can, rather
+        # than reading whole rows and slicing them afterward.
+        slices, slice = _push_down_slice(slices, slice)
+        if all(
+            s.indices(length) == (0, length, 1)
+            for s, length in zip(slices[1:], structure.shape[1:])
+        ):
+            # Whole rows are requested.
+            slices = slices[:1]
         raw_array = self.get_columns([variable], slices=slices)[variable]
         if raw_array.dtype != dtype:
             logger.warning(
@@ -783,63 +1270,137 @@ class DatasetFromDocuments:
         else:
             min_seq_num = 1 + slice_params[0]
             max_seq_num = 1 + slice_params[1]
-        column = []
-        descriptor_uids = [doc["uid"] for doc in self.metadata()["descriptors"]]
+        return self._get_columns_by_path(("time",), min_seq_num, max_seq_num)["time"]
 
-        def populate_column(min_seq_num, max_seq_num):
-            cursor = self._event_collection.aggregate(
-                [
-                    # Select Events for this Descriptor with the appropriate seq_num range.
-                    {
-                        "$match": {
-                            "descriptor": {"$in": descriptor_uids},
-                            # It's important to use a half-open interval here
-                            # so that the boundaries work.
-                            "seq_num": {"$gte": min_seq_num, "$lt": max_seq_num},
-                        },
-                    },
-                    # Include only the fields of interest.
-                    {
-                        "$project": {"descriptor": 1, "seq_num": 1, "time": 1},
-                    },
-                    # Sort by time.
-                    {"$sort": {"time": 1}},
-                    # If seq_num is repeated, take the latest one.
-                    {
-                        "$group": {
-                            "_id": "$seq_num",
-                            "doc": {"$last": "$$ROOT"},
-                        },
-                    },
-                    # Re-sort, now by seq_num which *should* be equivalent to
-                    # sorting by time but could not be in weird cases
-                    # (which I'm not aware have ever occurred) where an NTP sync
-                    # moves system time backward mid-run.
-                    {"$sort": {"doc.seq_num": 1}},
-                    # Extract the column of interest as an array.
-                    {
-                        "$group": {
-                            "_id": "$descriptor",
-                            "column": {"$push": "$doc.time"},
+    def _get_column_cache(self):
+        "Return the column cache if this run is complete, else None."
+        if self._run.metadata()["stop"] is None:
+            # This run may yet have more Events.
+            return None
+        return self._column_cache
+
+    def _column_cache_key(self, path, min_seq_num, max_seq_num, trailing_slice=()):
+        # The path encodes the sub_dict and the field, as in "data.x". The
+        # time column is shared by the "data" and "timestamps" datasets.
+        descriptor_uids = tuple(doc["uid"] for doc in self.metadata()["descriptors"])
+        key = (descriptor_uids, path, min_seq_num, max_seq_num)
+        if trailing_slice:
+            # slice objects are not hashable (before Python 3.12).
+            key += (tuple((s.start, s.stop, s.step) for s in trailing_slice),)
+        return key
+
+    def _column_path(self, key):
+        "Return the path to a column in an Event, as in 'data.x' or 'time'."
+        if key == "time":
+            return "time"
+        return f"{self._sub_dict}.{key}"
+
+    def _get_row_bytesizes(self, paths):
+        """
+        Look up how many bytes one row of each path adds to a page.
+
+        Sizes are measured once per stream, by sampling a few Events from each
+        Event Descriptor, and recorded in self._row_bytesizes, which is shared
+        by all the datasets in the stream.
+        """
+        to_measure = [path for path in paths if path not in self._row_bytesizes]
+        if to_measure:
+            self._measure_row_bytesizes(to_measure)
+        result = {}
+        for path in paths:
+            try:
+                result[path] = self._row_bytesizes[path]
+            except KeyError:
+                # There was nothing to measure yet. Guess, for now.
+                result[path] = self._estimate_row_bytesize(path)
+        return result
+
+    def _estimate_row_bytesize(self, path):
+        if path == "time":
+            return 8
+        sub_dict, _, key = path.partition(".")
+        # IMPORTANT: Access via self.metadata so that transforms are applied.
+        descriptor = self.metadata()["descriptors"][0]
+        return _estimate_row_bytesize(descriptor["data_keys"][key], sub_dict)
+
+    def _measure_row_bytesizes(self, paths):
+        aliases = {f"_{i}": path for i, path in enumerate(paths)}
+        measured = {}
+        for descriptor in self.metadata()["descriptors"]:
+            try:
+                cursor = self._event_collection.aggregate(
+                    [
+                        {"$match": {"descriptor": descriptor["uid"]}},
+                        {"$limit": ROW_BYTESIZE_SAMPLE_SIZE},
+                        # The BSON size of {"v": value} is within a byte of
+                        # the size of one element in the array that we $push
+                        # in each page.
+                        {
+                            "$project": {
+                                "_id": 0,
+                                **{
+                                    alias: {"$bsonSize": {"v": f"${path}"}}
+                                    for alias, path in aliases.items()
+                                },
+                            }
                         },
-                    },
-                ]
-            )
-            (result,) = cursor
-            column.extend(result["column"])
+                    ]
+                )
+                for sample in cursor:
+                    for alias, path in aliases.items():
+                        measured[path] = max(measured.get(path, 0), 1 + sample[alias])
+            except pymongo.errors.OperationFailure:
+                # This server does not support $bsonSize (MongoDB < 4.4 or
+                # mongomock). Record guesses so that we do not try again.
+                logger.debug("Could not measure row sizes with $bsonSize", exc_info=True)
+                for path in paths:
+                    self._row_bytesizes[path] = self._estimate_row_bytesize(path)
+                return
+        # If there are no Events yet (partial run), there is nothing to
+        # record, and we will try again on the next read.
+        for path, bytesize in measured.items():
+            self._row_bytesizes[path] = bytesize
 
-        # Aim for 10 MB pages to stay safely clear the MongoDB's hard limit
-        # of 16 MB.
-        TARGET_PAGE_BYTESIZE = 10_000_000
+    def _fetch_pages(self, fetch, tasks):
+        """
+        Call fetch(keys, min_seq_num, max_seq_num) for each task in tasks.
 
-        page_size = TARGET_PAGE_BYTESIZE // 8  # estimated row byte size is 8
-        boundaries = list(range(min_seq_num, 1 + max_seq_num, page_size))
-        if boundaries[-1] != max_seq_num:
-            boundaries.append(max_seq_num)
-        for min_, max_ in zip(boundaries[:-1], boundaries[1:]):
-            populate_column(min_, max_)
+        The pages are independent, so if page_fetch_concurrency > 1 they are
+        fetched concurrently on a bounded pool of threads. Either way, the
+        results are yielded in the order of tasks, with one item (a page) per
+        task, or more if a page had to be split, so that the caller can use
+        each page and let go of it before the next.
+        """
+        if (self._page_fetch_concurrency > 1) and (len(tasks) > 1):
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(self._page_fetch_concurrency, len(tasks)),
+                thread_name_prefix="databroker-page-fetch",
+            ) as executor:
+                results = executor.map(lambda task: self._fetch_page(fetch, *task), tasks)
+                for pages in results:
+                    yield from pages
+            return
+        for task in tasks:
+            yield from self._fetch_page(fetch, *task)
+
+    def _fetch_page(self, fetch, keys, min_seq_num, max_seq_num):
+        """
+        Call fetch(keys, min_seq_num, max_seq_num), splitting the page if it
+        turns out to be larger than the 16 MB MongoDB can return.
 
-        return numpy.array(column)
+        Returns a list of results, usually containing one item.
+        """
+        try:
+            return [fetch(keys, min_seq_num, max_seq_num)]
+        except pymongo.errors.OperationFailure as err:
+            if (err.code != BSON_OBJECT_TOO_LARGE) or (max_seq_num - min_seq_num < 2):
+                raise
+            # Our size estimate was too small. Try again with two halves.
+            middle = (min_seq_num + max_seq_num) // 2
+            return [
+                *self._fetch_page(fetch, keys, min_seq_num, middle),
+                *self._fetch_page(fetch, keys, middle, max_seq_num),
+            ]
 
     def get_columns(self, keys, slices):
         if slices is None:
@@ -850,50 +1411,187 @@ class DatasetFromDocuments:
             min_seq_num = 1 + slice_.start
             max_seq_num = 1 + slice_.stop
 
-        to_stack = self._inner_get_columns(tuple(keys), min_seq_num, max_seq_num)
+        trailing_slice = tuple(slices[1:]) if slices else ()
+        return self._inner_get_columns(tuple(keys), min_seq_num, max_seq_num, trailing_slice)
 
+    def _inner_get_columns(self, keys, min_seq_num, max_seq_num, trailing_slice=()):
+        paths = {key: self._column_path(key) for key in keys}
+        # External data is read by handlers, which may be able to read only
+        # the requested slice of each row. Other columns are read whole (and
+        # cached that way) and sliced here.
+        # IMPORTANT: Access via self.metadata so that transforms are applied.
+        data_keys = self.metadata()["descriptors"][0]["data_keys"]
+        pushed_down = set()
+        if trailing_slice and (self._sub_dict == "data"):
+            pushed_down.update(
+                path for key, path in paths.items()
+                if (path != "time") and ("external" in data_keys[key])
+            )
+        columns = self._get_columns_by_path(
+            tuple(path for path in paths.values() if path not in pushed_down),
+            min_seq_num,
+            max_seq_num,
+        )
+        if pushed_down:
+            columns.update(
+                self._get_columns_by_path(
+                    tuple(pushed_down), min_seq_num, max_seq_num, trailing_slice
+                )
+            )
         result = {}
-        for key, value in to_stack.items():
-            array = numpy.stack(value)
-            if slices:
-                sliced_array = array[(..., *slices[1:])]
-            else:
-                sliced_array = array
-            result[key] = sliced_array
-
+        for key, path in paths.items():
+            column = columns[path]
+            if trailing_slice and (path not in pushed_down):
+                column = column[(slice(None), *trailing_slice)]
+            result[key] = column
         return result
 
-    def _inner_get_columns(self, keys, min_seq_num, max_seq_num):
-        columns = {key: [] for key in keys}
+    def _get_columns_by_path(self, paths, min_seq_num, max_seq_num, trailing_slice=()):
+        """
+        Return {path: array} for paths like "time", "data.x", "timestamps.x".
+
+        For complete runs, columns are looked up in the column cache first.
+        Then, while we are running a pipeline over these Events anyway, we
+        also fetch the time and the timestamps for any data columns we read,
+        which cost a few bytes per row, and cache them for the "timestamps"
+        dataset and the time coordinate. This saves running separate
+        pipelines over the same Events for them when they are read next.
+        That is done only if the seq_num range is one in which those columns
+        are read themselves, so that they will be found in the cache.
+
+        If trailing_slice is given, only that part of each row of the
+        (external) columns at paths is read.
+        """
+        if not paths:
+            return {}
+        column_cache = self._get_column_cache()
+        if column_cache is None:
+            return self._query_columns(paths, min_seq_num, max_seq_num, trailing_slice)
+        columns = {}
+        for path in paths:
+            column = column_cache.get_column(
+                self._column_cache_key(path, min_seq_num, max_seq_num, trailing_slice)
+            )
+            if column is not None:
+                columns[path] = column
+        to_query = [path for path in paths if path not in columns]
+        if not to_query:
+            return columns
+        # IMPORTANT: Access via self.metadata so that transforms are applied.
+        data_keys = self.metadata()["descriptors"][0]["data_keys"]
+        siblings = []
+        if (min_seq_num, max_seq_num) in self._scalar_read_ranges():
+            for path in to_query:
+                sub_dict, _, key = path.partition(".")
+                if (sub_dict == "data") and ("external" not in data_keys[key]):
+                    siblings.append("time")
+                    if "chunks" not in data_keys[key]:
+                        # The timestamps are chunked like the time.
+                        siblings.append(f"timestamps.{key}")
+        for path in siblings:
+            if (path not in to_query) and (
+                self._column_cache_key(path, min_seq_num, max_seq_num) not in column_cache
+            ):
+                to_query.append(path)
+        for path, column in self._query_columns(
+            tuple(to_query), min_seq_num, max_seq_num, trailing_slice
+        ).items():
+            column_cache.put_column(
+                self._column_cache_key(path, min_seq_num, max_seq_num, trailing_slice), column
+            )
+            if path in paths:
+                columns[path] = column
+        return columns
+
+    def _scalar_read_ranges(self):
+        """
+        Return the (min_seq_num, max_seq_num) ranges in which the time and
+        timestamps columns are read: the whole stream, or one of their chunks.
+        """
+        ranges = {(1, self._cutoff_seq_num)}
+        if self._cutoff_seq_num > 1:
+            # These are chunked as in structure_from_descriptor.
+            (chunks,) = normalize_chunks(
+                ("auto",),
+                shape=(self._cutoff_seq_num - 1,),
+                limit=CHUNK_SIZE_LIMIT,
+                dtype=FLOAT_DTYPE.to_numpy_dtype(),
+            )
+            boundaries = [1 + offset for offset in itertools.accumulate(chunks, initial=0)]
+            ranges.update(zip(boundaries[:-1], boundaries[1:]))
+        return ranges
+
+    def _query_columns(self, paths, min_seq_num, max_seq_num, trailing_slice=()):
+        """
+        Run the pipelines that fetch the columns at paths, one per page.
+
+        Columns that are read together are fetched together, whether they
+        come from "time", "data", or "timestamps". The trailing_slice, if
+        any, applies to the external columns only.
+        """
+        # Map each path to its column, allocated when the first page arrives,
+        # and the number of rows written to it so far. External columns are
+        # gathered as lists of datum_ids.
+        columns = {path: None for path in paths}
+        num_rows = {path: 0 for path in paths}
+        datum_ids = {path: [] for path in paths}
         # IMPORTANT: Access via self.metadata so that transforms are applied.
         descriptors = self.metadata()["descriptors"]
         descriptor_uids = [doc["uid"] for doc in descriptors]
         # The `data_keys` in a series of Event Descriptor documents with the
         # same `name` MUST be alike, so we can just use the first one.
-        data_keys = [descriptors[0]["data_keys"][key] for key in keys]
-        is_externals = ["external" in data_key for data_key in data_keys]
-        expected_shapes = [tuple(data_key["shape"] or []) for data_key in data_keys]
-
-        def populate_columns(keys, min_seq_num, max_seq_num):
-            # This closes over the local variable columns and appends to its
-            # contents.
-            cursor = self._event_collection.aggregate(
-                [
-                    # Select Events for this Descriptor with the appropriate seq_num range.
-                    {
-                        "$match": {
-                            "descriptor": {"$in": descriptor_uids},
-                            # It's important to use a half-open interval here
-                            # so that the boundaries work.
-                            "seq_num": {"$gte": min_seq_num, "$lt": max_seq_num},
-                        },
-                    },
-                    # Include only the fields of interest.
+        data_keys = descriptors[0]["data_keys"]
+        keys = {}
+        is_externals = {}
+        expected_shapes = {}
+        # Columns of numbers with the declared shape can be decoded straight
+        # from raw BSON into arrays of the declared dtype. A custom
+        # validate_shape must still see every row, so leave nonscalar columns
+        # to it.
+        layouts = {}
+        for path in paths:
+            sub_dict, _, key = path.partition(".")
+            keys[path] = key or path
+            if sub_dict == "data":
+                data_key = data_keys[key]
+                is_externals[path] = "external" in data_key
+                expected_shapes[path] = tuple(data_key["shape"] or [])
+                dtype = None if is_externals[path] else _numeric_dtype(data_key)
+            else:
+                # The time and the timestamps are scalar floats.
+                is_externals[path] = False
+                expected_shapes[path] = ()
+                dtype = FLOAT_DTYPE.to_numpy_dtype()
+            if (dtype is None) or (
+                expected_shapes[path] and (self.validate_shape is not default_validate_shape)
+            ):
+                layouts[path] = None
+            else:
+                layouts[path] = (expected_shapes[path], dtype)
+        # Paths contain "." so they cannot name fields in $group.
+        aliases = {path: f"_{i}" for i, path in enumerate(paths)}
+
+        def fetch_columns(paths, min_seq_num, max_seq_num):
+            # Select Events for this Descriptor with the appropriate seq_num range.
+            match = {
+                "$match": {
+                    "descriptor": {"$in": descriptor_uids},
+                    # It's important to use a half-open interval here
+                    # so that the boundaries work.
+                    "seq_num": {"$gte": min_seq_num, "$lt": max_seq_num},
+                },
+            }
+            if self._has_duplicate_seq_nums:
+                pipeline = [
+                    match,
+                    # Include only the fields of interest, and the time,
+                    # which we sort by.
                     {
                         "$project": {
                             "descriptor": 1,
                             "seq_num": 1,
-                            **{f"{self._sub_dict}.{key}": 1 for key in keys},
+                            "time": 1,
+                            **{path: 1 for path in paths},
                         },
                     },
                     # Sort by time.
@@ -910,119 +1608,239 @@ class DatasetFromDocuments:
                     # (which I'm not aware have ever occurred) where an NTP sync
                     # moves system time backward mid-run.
                     {"$sort": {"doc.seq_num": 1}},
-                    # Extract the column of interest as an array.
+                    # Extract the columns of interest as arrays.
                     {
                         "$group": {
                             "_id": "$descriptor",
-                            **{
-                                key: {"$push": f"$doc.{self._sub_dict}.{key}"}
-                                for key in keys
-                            },
+                            **{aliases[path]: {"$push": f"$doc.{path}"} for path in paths},
                         },
                     },
                 ]
-            )
+            else:
+                # Without repeated seq_nums, there is nothing to deduplicate,
+                # so the Events can stream through in seq_num order without
+                # first being grouped in memory.
+                pipeline = [
+                    match,
+                    {"$sort": {"seq_num": 1}},
+                    {"$project": {"_id": 0, "seq_num": 1, **{path: 1 for path in paths}}},
+                    # Extract the columns of interest as arrays, along with
+                    # seq_num so we can check our assumption.
+                    {
+                        "$group": {
+                            "_id": None,
+                            "_seq_num": {"$push": "$seq_num"},
+                            **{aliases[path]: {"$push": f"${path}"} for path in paths},
+                        },
+                    },
+                ]
+            raw_event_collection = self._raw_event_collection
+            cursor = (
+                raw_event_collection if raw_event_collection is not None else self._event_collection
+            ).aggregate(pipeline)
             (result,) = cursor
-            for key, expected_shape, is_external in zip(
-                keys, expected_shapes, is_externals
-            ):
-                if expected_shape and (not is_external):
-                    validated_column = list(
-                        map(
-                            lambda item: self.validate_shape(
-                                key, numpy.asarray(item), expected_shape
-                            ),
-                            result[key],
-                        )
+            decoded = _decode_columns(
+                result,
+                {aliases[path]: layouts[path] for path in paths},
+                max_seq_num - min_seq_num,
+            )
+            if not self._has_duplicate_seq_nums:
+                (seq_nums,) = _decode_columns(
+                    result, {"_seq_num": ((), numpy.dtype("int64"))}, max_seq_num - min_seq_num
+                ).values()
+                if (numpy.diff(seq_nums) <= 0).any():
+                    # Events with repeated seq_num were added after the
+                    # stream was inspected. Fall back to deduplicating.
+                    logger.info(
+                        "Found repeated seq_num in stream %r of run %r",
+                        self._stream_name,
+                        self._run.metadata()["start"]["uid"],
                     )
-                else:
-                    validated_column = result[key]
-                columns[key].extend(validated_column)
-
-        scalars = []
-        nonscalars = []
-        estimated_nonscalar_row_bytesizes = []
-        estimated_scalar_row_bytesize = 0
-        for key, data_key, is_external in zip(keys, data_keys, is_externals):
-            if (not data_key["shape"]) or is_external:
-                # This is either a literal scalar value of a datum_id.
-                scalars.append(key)
-                if data_key["dtype"] == "string":
-                    # Give a generous amount of headroom here.
-                    estimated_scalar_row_bytesize += 10_000  # 10 kB
-                else:
-                    # 64-bit integer or float
-                    estimated_scalar_row_bytesize += 8
+                    self._has_duplicate_seq_nums = True
+                    return fetch_columns(paths, min_seq_num, max_seq_num)
+            page = {}
+            for path in paths:
+                column = decoded[aliases[path]]
+                expected_shape = expected_shapes[path]
+                if isinstance(column, numpy.ndarray):
+                    # Decoded from raw BSON, so it has exactly the expected shape.
+                    pass
+                elif expected_shape and (not is_externals[path]):
+                    if self.validate_shape is default_validate_shape:
+                        # Reconcile all the rows with the expected shape at once.
+                        column = default_validate_column_shape(
+                            keys[path], column, expected_shape
+                        )
+                    else:
+                        column = list(
+                            map(
+                                lambda item: self.validate_shape(
+                                    keys[path], numpy.asarray(item), expected_shape
+                                ),
+                                column,
+                            )
+                        )
+                page[path] = column
+            return page
+
+        # Group the columns, scalar and nonscalar alike, into as few pages
+        # as will fit, based on their measured (or guessed) size.
+        plan = _plan_pages(self._get_row_bytesizes(paths), min_seq_num, max_seq_num)
+        tasks = [
+            (group, min_, max_)
+            for group, boundaries in plan
+            for min_, max_ in zip(boundaries[:-1], boundaries[1:])
+        ]
+        # The pages come back in the order of the tasks, which is ordered by
+        # seq_num within each group. Write each page into its place in a
+        # column allocated once, with room for every seq_num in the range,
+        # rather than holding all the pages until they can be concatenated.
+        max_num_rows = max_seq_num - min_seq_num
+        for page in self._fetch_pages(fetch_columns, tasks):
+            for path, column in page.items():
+                if is_externals[path]:
+                    datum_ids[path].extend(column)
+                    continue
+                if not (isinstance(column, numpy.ndarray) or expected_shapes[path]):
+                    column = numpy.asarray(column)
+                columns[path] = _set_rows(
+                    columns[path], max_num_rows, num_rows[path], column
+                )
+                num_rows[path] += len(column)
+
+        arrays = {}
+        for path in paths:
+            if is_externals[path]:
+                # We have a column of datum_ids, and we need to look up the
+                # data that they reference.
+                arrays[path] = self._fill_column(
+                    keys[path], datum_ids[path], expected_shapes[path], trailing_slice
+                )
+            elif columns[path] is None:
+                arrays[path] = numpy.array([])
+            elif num_rows[path] < max_num_rows:
+                # Some seq_nums in the range are missing. Copy, so as not to
+                # hold on to the unused rows.
+                arrays[path] = columns[path][: num_rows[path]].copy()
             else:
-                nonscalars.append(key)
-                estimated_nonscalar_row_bytesizes.append(
-                    numpy.prod(data_key["shape"]) * 8
+                arrays[path] = columns[path]
+
+        return arrays
+
+    def _fill_column(self, key, datum_ids, expected_shape, trailing_slice=()):
+        """
+        Load the external data referenced by a column of datum_ids.
+
+        Rather than filling one mock Event at a time, look up all the Datum
+        documents at once, group the rows by Resource, and use one handler
+        per Resource for all of its rows. Handlers that implement
+        read_many(datum_kwargs_list) load all of their rows in one call.
+
+        If fill_concurrency > 1, the Resources are read concurrently on a
+        bounded pool of threads, so that handlers spend their time decoding
+        files or waiting on the filesystem in parallel. Each handler is used
+        by one thread only, as handlers hold state (open files, datasets)
+        that is not safe to share between threads. The rows come back in
+        order regardless.
+
+        If trailing_slice is given, return only that part of each row.
+        Handlers whose read_many accepts a ``slice`` read only that part;
+        for others, each row is sliced after it is read.
+        """
+        if not datum_ids:
+            return numpy.array([])
+        datums = self._run.get_datums(datum_ids)
+        rows_by_resource = collections.defaultdict(list)
+        for row, datum_id in enumerate(datum_ids):
+            rows_by_resource[datums[datum_id]["resource"]].append(row)
+        # Group the Resources by handler (usually one each), so that each
+        # handler is used by one task.
+        tasks = {}
+        for resource_uid, rows in rows_by_resource.items():
+            resource = self._run.get_resource(resource_uid)
+            handler = self._run.get_handler(resource)
+            tasks.setdefault(id(handler), (handler, []))[1].append(
+                (resource, rows, [datums[datum_ids[row]] for row in rows])
+            )
+        tasks = list(tasks.values())
+
+        def read_rows(task):
+            handler, reads = task
+            return [
+                self._read_rows(
+                    resource, handler, resource_datums, expected_shape, trailing_slice
                 )
+                for resource, _, resource_datums in reads
+            ]
 
-        # Aim for 10 MB pages to stay safely clear the MongoDB's hard limit
-        # of 16 MB.
-        TARGET_PAGE_BYTESIZE = 10_000_000
-
-        # Fetch scalars all together.
-        if scalars:
-            page_size = TARGET_PAGE_BYTESIZE // estimated_scalar_row_bytesize
-            boundaries = list(range(min_seq_num, 1 + max_seq_num, page_size))
-            if boundaries[-1] != max_seq_num:
-                boundaries.append(max_seq_num)
-            for min_, max_ in zip(boundaries[:-1], boundaries[1:]):
-                populate_columns(tuple(scalars), min_, max_)
-
-        # Fetch each nonscalar column individually.
-        # TODO We could batch a couple nonscalar columns at at ime based on
-        # their size if we need to squeeze more performance out here. But maybe
-        # we can get away with never adding that complexity.
-        for key, est_row_bytesize in zip(nonscalars, estimated_nonscalar_row_bytesizes):
-            page_size = TARGET_PAGE_BYTESIZE // est_row_bytesize
-            boundaries = list(range(min_seq_num, 1 + max_seq_num, page_size))
-            if boundaries[-1] != max_seq_num:
-                boundaries.append(max_seq_num)
-            for min_, max_ in zip(boundaries[:-1], boundaries[1:]):
-                populate_columns((key,), min_, max_)
-
-        # If data is external, we now have a column of datum_ids, and we need
-        # to look up the data that they reference.
-        to_stack = collections.defaultdict(list)
-        # Any arbitrary valid descriptor uid will work; we just need to satisfy
-        # the Filler with our mocked Event below. So we pick the first one.
-        descriptor_uid = descriptor_uids[0]
-        for key, expected_shape, is_external in zip(
-            keys, expected_shapes, is_externals
-        ):
-            column = columns[key]
-            if is_external:
-                filled_column = []
-                for datum_id in column:
-                    # HACK to adapt Filler which is designed to consume whole,
-                    # streamed documents, to this column-based access mode.
-                    mock_event = {
-                        "data": {key: datum_id},
-                        "descriptor": descriptor_uid,
-                        "uid": "PLACEHOLDER",
-                        "filled": {key: False},
-                    }
-                    filled_mock_event = _fill(
-                        self._run.filler,
-                        mock_event,
-                        self._run.lookup_resource_for_datum,
-                        self._run.get_resource,
-                        self._run.get_datum_for_resource,
-                        last_datum_id=None,
-                    )
-                    filled_data = filled_mock_event["data"][key]
-                    validated_filled_data = self.validate_shape(
-                        key, filled_data, expected_shape
-                    )
-                    filled_column.append(validated_filled_data)
-                to_stack[key].extend(filled_column)
-            else:
-                to_stack[key].extend(column)
+        if (self._fill_concurrency > 1) and (len(tasks) > 1):
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(self._fill_concurrency, len(tasks)),
+                thread_name_prefix="databroker-fill",
+            ) as executor:
+                results = list(executor.map(read_rows, tasks))
+        else:
+            results = map(read_rows, tasks)
+        column = None
+        for (_, reads), task_results in zip(tasks, results):
+            for (_, rows, _), (filled_rows, is_sliced) in zip(reads, task_results):
+                column = self._set_filled_rows(
+                    column, key, len(datum_ids), rows, filled_rows, is_sliced,
+                    expected_shape, trailing_slice,
+                )
+        return column
 
-        return to_stack
+    def _set_filled_rows(
+        self, column, key, length, rows, filled_rows, is_sliced, expected_shape, trailing_slice
+    ):
+        "Validate the rows that _read_rows returned and write them into column."
+        if (not is_sliced) and (self.validate_shape is default_validate_shape):
+            filled_rows = default_validate_column_shape(key, filled_rows, expected_shape)
+            if trailing_slice:
+                filled_rows = filled_rows[(slice(None), *trailing_slice)]
+            is_sliced = True
+        for row, filled_data in zip(rows, filled_rows):
+            if not is_sliced:
+                filled_data = numpy.asarray(
+                    self.validate_shape(key, filled_data, expected_shape)
+                )
+                if trailing_slice:
+                    filled_data = filled_data[trailing_slice]
+            column = _set_row(column, length, row, numpy.asarray(filled_data))
+        return column
+
+    def _read_rows(self, resource, handler, datums, expected_shape, trailing_slice):
+        """
+        Use the handler for resource to read the data referenced by datums.
+
+        Returns (filled_rows, is_sliced). If is_sliced, the handler has read
+        only the trailing_slice of each row, and the rows already have the
+        expected (sliced) shape. Otherwise, the rows still need validating
+        and slicing.
+        """
+        retry_intervals = self._run.filler.retry_intervals
+        # A custom validate_shape may need to see whole rows. The default one
+        # passes through data of the expected shape unchanged, so data that
+        # a handler has sliced can be checked against the sliced shape.
+        if (
+            trailing_slice
+            and (self.validate_shape is default_validate_shape)
+            and _accepts_slice(getattr(handler, "read_many", None))
+        ):
+            filled_rows = _call_handler(
+                lambda: handler.read_many(
+                    [datum["datum_kwargs"] for datum in datums], slice=trailing_slice
+                ),
+                datums,
+                resource,
+                retry_intervals,
+            )
+            sliced_shape = _sliced_shape(expected_shape, trailing_slice)
+            if all(numpy.shape(filled_data) == sliced_shape for filled_data in filled_rows):
+                return filled_rows, True
+            # The data does not have the declared shape, so it needs
+            # validate_shape to see whole rows. Read them again.
+        return _read_datums(handler, resource, datums, retry_intervals), False
 
 
 class Config(MapAdapter):
@@ -1126,6 +1944,9 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
         cache_ttl_complete=60,  # seconds
         cache_ttl_partial=2,  # seconds
         validate_shape=None,
+        page_fetch_concurrency=1,
+        fill_concurrency=1,
+        column_cache_size=100_000_000,  # bytes
     ):
         """
         Create a MongoAdapter from MongoDB with the "normalized" (original) layout.
@@ -1176,6 +1997,17 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
         validate_shape: func
             function that will be used to validate that the shape of the data matches
             the shape in the descriptor document
+        page_fetch_concurrency : int
+            Maximum number of pages of a column read to fetch from MongoDB
+            concurrently. Default 1 fetches pages one after another.
+        fill_concurrency : int
+            Maximum number of threads to use for loading the external data
+            in one column read (i.e. calling handlers), each reading from
+            different Resources. Default 1 loads it in the calling thread.
+        column_cache_size : int
+            Maximum total size (in bytes) of the columns read from *complete*
+            BlueskyRuns to hold in memory for reuse. Default 100 MB. Set to 0
+            to disable.
         """
         metadatastore_db = _get_database(uri)
         if asset_registry_uri is None:
@@ -1194,6 +2026,10 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
         cache_of_partial_bluesky_runs = cachetools.TTLCache(
             ttl=cache_ttl_partial, maxsize=100
         )
+        if column_cache_size:
+            column_cache = ColumnCache(maxsize=column_cache_size)
+        else:
+            column_cache = None
         return cls(
             metadatastore_db=metadatastore_db,
             asset_registry_db=asset_registry_db,
@@ -1205,6 +2041,9 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
             metadata=metadata,
             access_policy=access_policy,
             validate_shape=validate_shape,
+            page_fetch_concurrency=page_fetch_concurrency,
+            fill_concurrency=fill_concurrency,
+            column_cache=column_cache,
         )
 
     @classmethod
@@ -1219,6 +2058,9 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
         cache_ttl_complete=60,  # seconds
         cache_ttl_partial=2,  # seconds
         validate_shape=None,
+        page_fetch_concurrency=1,
+        fill_concurrency=1,
+        column_cache_size=100_000_000,  # bytes
     ):
         """
         Create a transient MongoAdapter from backed by "mongomock".
@@ -1265,6 +2107,17 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
         validate_shape: func
             function that will be used to validate that the shape of the data matches
             the shape in the descriptor document
+        page_fetch_concurrency : int
+            Maximum number of pages of a column read to fetch from MongoDB
+            concurrently. Default 1 fetches pages one after another.
+        fill_concurrency : int
+            Maximum number of threads to use for loading the external data
+            in one column read (i.e. calling handlers), each reading from
+            different Resources. Default 1 loads it in the calling thread.
+        column_cache_size : int
+            Maximum total size (in bytes) of the columns read from *complete*
+            BlueskyRuns to hold in memory for reuse. Default 100 MB. Set to 0
+            to disable.
         """
         import mongomock
 
@@ -1282,6 +2135,10 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
         cache_of_partial_bluesky_runs = cachetools.TTLCache(
             ttl=cache_ttl_partial, maxsize=100
         )
+        if column_cache_size:
+            column_cache = ColumnCache(maxsize=column_cache_size)
+        else:
+            column_cache = None
         return cls(
             metadatastore_db=metadatastore_db,
             asset_registry_db=asset_registry_db,
@@ -1293,6 +2150,9 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
             metadata=metadata,
             access_policy=access_policy,
             validate_shape=validate_shape,
+            page_fetch_concurrency=page_fetch_concurrency,
+            fill_concurrency=fill_concurrency,
+            column_cache=column_cache,
         )
 
     def __init__(
@@ -1309,6 +2169,9 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
         sorting=None,
         access_policy=None,
         validate_shape=None,
+        page_fetch_concurrency=1,
+        fill_concurrency=1,
+        column_cache=None,
     ):
         "This is not user-facing. Use MongoAdapter.from_uri."
         self._run_start_collection = metadatastore_db.get_collection("run_start")
@@ -1343,6 +2206,9 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
         elif isinstance(validate_shape, str):
             validate_shape = import_object(validate_shape)
         self.validate_shape = validate_shape
+        self.page_fetch_concurrency = int(page_fetch_concurrency)
+        self.fill_concurrency = int(fill_concurrency)
+        self.column_cache = column_cache
         super().__init__()
 
     @property
@@ -1420,6 +2286,9 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
             sorting=sorting,
             access_policy=self.access_policy,
             validate_shape=self.validate_shape,
+            page_fetch_concurrency=self.page_fetch_concurrency,
+            fill_concurrency=self.fill_concurrency,
+            column_cache=self.column_cache,
             **kwargs,
         )
 
@@ -1450,34 +2319,52 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
 
     def _get_run(self, run_start_doc):
         "Get a BlueskyRun, either from a cache or by making one if needed."
-        uid = run_start_doc["uid"]
-        try:
-            return self._cache_of_bluesky_runs[uid]
-        except KeyError:
-            run = self._build_run(run_start_doc)
-            # Choose a cache depending on whethter the run is complete (in
-            # which case updates are rare) or incomplete/partial (in which case
-            # more data is likely incoming soon).
-            if run.metadata().get("stop") is None:
-                self._cache_of_partial_bluesky_runs[uid] = run
-            else:
-                self._cache_of_complete_bluesky_runs[uid] = run
-            return run
+        (run,) = self._get_runs([run_start_doc])
+        return run
+
+    def _get_runs(self, run_start_docs):
+        """
+        Get a BlueskyRun for each of run_start_docs, from a cache or made.
+
+        The runs that need making are made together, with one query for all
+        of their Stop documents and one for all of their stream names.
+        """
+        runs = {}
+        to_build = []
+        for run_start_doc in run_start_docs:
+            uid = run_start_doc["uid"]
+            try:
+                runs[uid] = self._cache_of_bluesky_runs[uid]
+            except KeyError:
+                to_build.append(run_start_doc)
+        if to_build:
+            uids = [run_start_doc["uid"] for run_start_doc in to_build]
+            run_stop_docs = self._get_stop_docs(uids)
+            stream_names = self._get_stream_names(uids)
+            for run_start_doc in to_build:
+                uid = run_start_doc["uid"]
+                run_stop_doc = run_stop_docs.get(uid)
+                runs[uid] = self._build_run(
+                    run_start_doc, run_stop_doc, stream_names.get(uid, [])
+                )
+                # Choose a cache depending on whethter the run is complete (in
+                # which case updates are rare) or incomplete/partial (in which case
+                # more data is likely incoming soon).
+                if run_stop_doc is None:
+                    self._cache_of_partial_bluesky_runs[uid] = runs[uid]
+                else:
+                    self._cache_of_complete_bluesky_runs[uid] = runs[uid]
+        return [runs[run_start_doc["uid"]] for run_start_doc in run_start_docs]
 
     def _clear_from_cache(self, uid):
         self._cache_of_partial_bluesky_runs.pop(uid, None)
         self._cache_of_complete_bluesky_runs.pop(uid, None)
 
-    def _build_run(self, run_start_doc):
+    def _build_run(self, run_start_doc, run_stop_doc, stream_names):
         "This should not be called directly, even internally. Use _get_run."
-        # Instantiate a BlueskyRun for this run_start_doc.
+        # Instantiate a BlueskyRun for this run_start_doc. The run_stop_doc
+        # may be None; that's fine.
         uid = run_start_doc["uid"]
-        # This may be None; that's fine.
-        run_stop_doc = self._get_stop_doc(uid)
-        stream_names = self._event_descriptor_collection.distinct(
-            "name",
-            {"run_start": uid},
-        )
         mapping = {}
         for stream_name in stream_names:
             mapping[stream_name] = functools.partial(
@@ -1522,6 +2409,8 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
                     "$group": {
                         "_id": "descriptor",
                         "highest_seq_num": {"$max": "$seq_num"},
+                        "lowest_seq_num": {"$min": "$seq_num"},
+                        "num_events": {"$sum": 1},
                     },
                 },
             ]
@@ -1532,10 +2421,20 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
             cutoff_seq_num = (
                 1 + result["highest_seq_num"]
             )  # `1 +` because we use a half-open interval
+            # If there are more Events than distinct seq_nums could fill the
+            # range, some seq_num is repeated. (This also errs on the side of
+            # deduplicating when some seq_num is skipped.) Column reads check
+            # the seq_nums they get, in case duplicates are added later.
+            has_duplicate_seq_nums = result["num_events"] != (
+                1 + result["highest_seq_num"] - result["lowest_seq_num"]
+            )
         else:
             cutoff_seq_num = 1
+            has_duplicate_seq_nums = False
         object_names = event_descriptors[0]["object_keys"]
         run = self[run_start_uid]
+        # Measured byte sizes of fields, filled in lazily when they are read
+        row_bytesizes = {}
         mapping = OneShotCachedMap(
             {
                 "data": lambda: DatasetFromDocuments(
@@ -1547,6 +2446,11 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
                     root_map=self.root_map,
                     sub_dict="data",
                     validate_shape=self.validate_shape,
+                    row_bytesizes=row_bytesizes,
+                    page_fetch_concurrency=self.page_fetch_concurrency,
+                    fill_concurrency=self.fill_concurrency,
+                    column_cache=self.column_cache,
+                    has_duplicate_seq_nums=has_duplicate_seq_nums,
                 ),
                 "timestamps": lambda: DatasetFromDocuments(
                     run=run,
@@ -1557,6 +2461,11 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
                     root_map=self.root_map,
                     sub_dict="timestamps",
                     validate_shape=self.validate_shape,
+                    row_bytesizes=row_bytesizes,
+                    page_fetch_concurrency=self.page_fetch_concurrency,
+                    fill_concurrency=self.fill_concurrency,
+                    column_cache=self.column_cache,
+                    has_duplicate_seq_nums=has_duplicate_seq_nums,
                 ),
                 "config": lambda: Config(
                     OneShotCachedMap(
@@ -1594,6 +2503,7 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
             event_collection=self._event_collection,
             cutoff_seq_num=cutoff_seq_num,
             run=run,
+            row_bytesizes=row_bytesizes,
         )
 
     def __getitem__(self, key):
@@ -1604,10 +2514,76 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
             raise KeyError(key)
         return self._get_run(run_start_doc)
 
+    def lookup(self, keys):
+        """
+        Look up many runs by scan_id, uid, or partial uid in one query.
+
+        Integers are scan_ids, matching the latest run with that scan_id,
+        as ScanID(..., duplicates="latest") does. Strings of 36 characters
+        are uids, and shorter strings are partial uids, as PartialUID.
+
+        Returns a dict mapping each key with a match to its BlueskyRun.
+        """
+        scan_ids = []
+        uids = []
+        partial_uids = []
+        for key in keys:
+            if isinstance(key, str):
+                if len(key) == 36:
+                    uids.append(key)
+                elif len(key) < 5:
+                    raise QueryValueError(
+                        f"Partial uid {key!r} is too short. "
+                        "It must include at least 5 characters."
+                    )
+                else:
+                    partial_uids.append(key)
+            else:
+                scan_ids.append(key)
+        clauses = []
+        if scan_ids:
+            clauses.append({"scan_id": {"$in": scan_ids}})
+        if uids:
+            clauses.append({"uid": {"$in": uids}})
+        for prefix in partial_uids:
+            clauses.append({"uid": {"$regex": f"^{re.escape(prefix)}"}})
+        if not clauses:
+            return {}
+        run_start_docs = self._run_start_collection.find(
+            self._build_mongo_query({"$or": clauses}), {"_id": False}
+        ).sort(self._sorting + [("_id", 1)])
+        by_scan_id = {}
+        by_uid = {}
+        for run_start_doc in run_start_docs:
+            # Later runs in the sort order replace earlier ones.
+            by_scan_id[run_start_doc.get("scan_id")] = run_start_doc
+            by_uid[run_start_doc["uid"]] = run_start_doc
+        sorted_uids = sorted(by_uid)
+        matches_by_key = {}
+        for key in keys:
+            if isinstance(key, str):
+                # The uids that start with key are adjacent in sorted order.
+                matches = []
+                i = bisect.bisect_left(sorted_uids, key)
+                while i < len(sorted_uids) and sorted_uids[i].startswith(key):
+                    matches.append(by_uid[sorted_uids[i]])
+                    i += 1
+                if len(matches) > 1:
+                    raise QueryValueError(
+                        f"Partial uid {key} has multiple matches, "
+                        "listed below. Include more characters. Matches:\n"
+                        + "\n".join(doc["uid"] for doc in matches)
+                    )
+            else:
+                matches = [by_scan_id[key]] if key in by_scan_id else []
+            if matches:
+                (matches_by_key[key],) = matches
+        runs = self._get_runs(list(matches_by_key.values()))
+        return dict(zip(matches_by_key, runs))
+
     def _chunked_find(self, collection, query, *args, skip=0, limit=None, **kwargs):
         # This is an internal chunking that affects how much we pull from
         # MongoDB at a time.
-        CURSOR_LIMIT = 100  # TODO Tune this for performance.
         if limit is not None and limit < CURSOR_LIMIT:
             initial_limit = limit
         else:
@@ -1692,11 +2668,26 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
         else:
             return {}
 
-    def _get_stop_doc(self, run_start_uid):
-        "This may return None."
-        return self._run_stop_collection.find_one(
-            {"run_start": run_start_uid}, {"_id": False}
+    def _get_stop_docs(self, run_start_uids):
+        "Map each of run_start_uids that has a Stop document to it."
+        run_stop_docs = {}
+        for run_stop_doc in self._run_stop_collection.find(
+            {"run_start": {"$in": list(run_start_uids)}}, {"_id": False}
+        ):
+            # If there is more than one, use the first, as find_one would.
+            run_stop_docs.setdefault(run_stop_doc["run_start"], run_stop_doc)
+        return run_stop_docs
+
+    def _get_stream_names(self, run_start_uids):
+        "Map each of run_start_uids that has any streams to their names."
+        cursor = self._event_descriptor_collection.aggregate(
+            [
+                {"$match": {"run_start": {"$in": list(run_start_uids)}}},
+                {"$group": {"_id": "$run_start", "names": {"$push": "$name"}}},
+            ]
         )
+        # A stream may have more than one descriptor. List each name once.
+        return {result["_id"]: list(dict.fromkeys(result["names"])) for result in cursor}
 
     def __iter__(self):
         for run_start_doc in self._chunked_find(
@@ -1813,15 +2804,20 @@ class MongoAdapter(collections.abc.Mapping, CatalogOfBlueskyRunsMixin, IndexersM
             limit = stop - skip
         else:
             limit = None
-        for run_start_doc in self._chunked_find(
-            self._run_start_collection,
-            self._build_mongo_query(),
-            skip=skip,
-            limit=limit,
-        ):
-            uid = run_start_doc["uid"]
-            run = self._get_run(run_start_doc)
-            yield (uid, run)
+        pages = toolz.itertoolz.partition_all(
+            CURSOR_LIMIT,
+            self._chunked_find(
+                self._run_start_collection,
+                self._build_mongo_query(),
+                skip=skip,
+                limit=limit,
+            ),
+        )
+        for run_start_docs in pages:
+            # Make the runs on each page together.
+            runs = self._get_runs(run_start_docs)
+            for run_start_doc, run in zip(run_start_docs, runs):
+                yield (run_start_doc["uid"], run)
 
 
 def full_text_search(query, catalog):
@@ -2070,60 +3066,390 @@ JSON_DTYPE_TO_MACHINE_DATA_TYPE = {
 }
 
 
-def _fill(
-    filler,
-    event,
-    lookup_resource_for_datum,
-    get_resource,
-    get_datum_for_resource,
-    last_datum_id=None,
-):
-    try:
-        _, filled_event = filler("event", event)
-        return filled_event
-    except event_model.UnresolvableForeignKeyError as err:
-        datum_id = err.key
-        if datum_id == last_datum_id:
-            # We tried to fetch this Datum on the last trip
-            # trip through this method, and apparently it did not
-            # work. We are in an infinite loop. Bail!
-            raise
-
-        # try to fast-path looking up the resource uid if this works
-        # it saves us a a database hit (to get the datum document)
-        if "/" in datum_id:
-            resource_uid, _ = datum_id.split("/", 1)
-        # otherwise do it the standard way
+def _estimate_row_bytesize(data_key, sub_dict):
+    """
+    Guess how many bytes one row of a field adds to a page.
+
+    This is used only when the sizes could not be measured from the data.
+    """
+    if sub_dict == "timestamps":
+        return 8
+    if (not data_key["shape"]) or ("external" in data_key):
+        # This is either a literal scalar value of a datum_id.
+        if data_key["dtype"] == "string":
+            # Give a generous amount of headroom here.
+            return 10_000  # 10 kB
+        # 64-bit integer or float
+        return 8
+    return int(numpy.prod(data_key["shape"])) * 8
+
+
+def _raw_bson_collection(collection):
+    """
+    Return a view of collection that yields RawBSONDocuments, or None.
+
+    This is only supported by real pymongo collections, not mongomock.
+    """
+    if not isinstance(collection, pymongo.collection.Collection):
+        return None
+    return collection.with_options(
+        codec_options=collection.codec_options.with_options(document_class=RawBSONDocument)
+    )
+
+
+def _decode_columns(result, layouts, max_rows):
+    """
+    Extract the columns in layouts from the result of a page's aggregation.
+
+    If result is a RawBSONDocument, columns of numbers are decoded directly
+    into numpy arrays, given a (row_shape, dtype) layout for each key. Anything
+    else, or any key whose layout is None, comes back as a list, as usual.
+    """
+    columns = {}
+    if isinstance(result, RawBSONDocument):
+        offsets = field_offsets(result.raw)
+        for key, layout in layouts.items():
+            type_code, offset = offsets[key]
+            if (layout is None) or (type_code != ARRAY):
+                continue
+            row_shape, dtype = layout
+            array = decode_array(result.raw, offset, row_shape, max_rows, dtype)
+            if array is not None:
+                columns[key] = array
+    for key in layouts:
+        if key not in columns:
+            columns[key] = result[key]
+    return columns
+
+
+def _numeric_dtype(data_key):
+    """
+    Return the numpy dtype of a column of numbers (or booleans), else None.
+    """
+    if _try_descr(data_key) is not None:
+        return None
+    dt_np = data_key.get("dtype_numpy") or data_key.get("dtype_str")
+    if dt_np is not None:
+        dtype = numpy.dtype(dt_np)
+    else:
+        dtype = JSON_DTYPE_TO_MACHINE_DATA_TYPE[data_key["dtype"]].to_numpy_dtype()
+    if dtype.kind in "biuf":
+        return dtype
+    return None
+
+
+def _page_boundaries(min_seq_num, max_seq_num, page_size):
+    "Split the half-open interval [min_seq_num, max_seq_num) into pages."
+    boundaries = list(range(min_seq_num, 1 + max_seq_num, page_size))
+    if boundaries[-1] != max_seq_num:
+        boundaries.append(max_seq_num)
+    return boundaries
+
+
+def _plan_pages(row_bytesizes, min_seq_num, max_seq_num):
+    """
+    Pack columns into as few aggregation pages as fit under TARGET_PAGE_BYTESIZE.
+
+    Parameters
+    ----------
+    row_bytesizes : dict
+        Maps each key to the number of bytes that one row of it adds to a page.
+    min_seq_num, max_seq_num : int
+        Half-open interval of seq_num to fetch
+
+    Returns
+    -------
+    plan : list
+        List of ``(keys, boundaries)`` pairs, one per group of keys that are
+        fetched together, where ``boundaries`` are the seq_num page edges.
+    """
+    # First-fit decreasing: the number of round trips grows with the total
+    # byte size of each group and with the number of groups, so we combine
+    # columns unless a single row of the combination would overflow a page.
+    groups = []  # list of [bytesize_of_one_row, keys]
+    for key in sorted(row_bytesizes, key=row_bytesizes.get, reverse=True):
+        bytesize = row_bytesizes[key]
+        for group in groups:
+            if group[0] + bytesize <= TARGET_PAGE_BYTESIZE:
+                group[0] += bytesize
+                group[1].append(key)
+                break
         else:
-            resource_uid = lookup_resource_for_datum(datum_id)
+            groups.append([bytesize, [key]])
+    plan = []
+    for bytesize, keys in groups:
+        page_size = max(1, TARGET_PAGE_BYTESIZE // max(1, bytesize))
+        plan.append(
+            (tuple(keys), _page_boundaries(min_seq_num, max_seq_num, page_size))
+        )
+    return plan
+
 
-        # but, it might be the case that the key just happens to have
-        # a '/' in it and it does not have any semantic meaning so we
-        # optimistically try
+def _call_handler(func, datums, resource, retry_intervals):
+    """
+    Call func() to load the data for some Datums, as event_model.Filler would.
+
+    Retry on IOError, because the file may not be visible on the filesystem
+    yet, and raise DataNotAccessible if we run out of attempts.
+    """
+    error = None
+    for interval in [0] + list(retry_intervals):
+        time.sleep(interval)
         try:
-            resource = get_resource(uid=resource_uid)
-        # and then fall back to the standard way to be safe
-        except ValueError:
-            resource = get_resource(lookup_resource_for_datum(datum_id))
-
-        filler("resource", resource)
-        # Pre-fetch all datum for this resource.
-        for datum in get_datum_for_resource(resource_uid=resource_uid):
-            filler("datum", datum)
-        # TODO -- When to clear the datum cache in filler?
-
-        # Re-enter and try again now that the Filler has consumed the
-        # missing Datum. There might be another missing Datum in this same
-        # Event document (hence this re-entrant structure) or might be good
-        # to go.
-        return _fill(
-            filler,
-            event,
-            lookup_resource_for_datum,
-            get_resource,
-            get_datum_for_resource,
-            last_datum_id=datum_id,
+            return func()
+        except IOError as err:
+            error = err
+    raise event_model.DataNotAccessible(
+        f"Filler was unable to load the data referenced by "
+        f"the Datum document(s) {datums} and the Resource "
+        f"document {resource}."
+    ) from error
+
+
+def _push_down_slice(block_slices, slice):
+    """
+    Fold the trailing dimensions of slice, as given to read_block, into the
+    slices that select the block.
+
+    Returns (block_slices, remainder), where remainder is whatever part of
+    slice must still be applied to the block after it is read, or None.
+    Only slices with a positive step are folded in; anything else is left
+    in the remainder.
+    """
+    if slice is None:
+        return block_slices, None
+    if not isinstance(slice, tuple):
+        slice = (slice,)
+    if (len(slice) > len(block_slices)) or not all(
+        isinstance(s, builtins.slice) and ((s.step is None) or (s.step > 0)) for s in slice
+    ):
+        return block_slices, slice
+    block_slices = list(block_slices)
+    for dim, s in enumerate(slice[1:], start=1):
+        block = block_slices[dim]
+        start, stop, step = s.indices(block.stop - block.start)
+        block_slices[dim] = builtins.slice(
+            block.start + start, block.start + max(start, stop), step
         )
+    return block_slices, slice[:1] or None
+
+
+def _sliced_shape(shape, trailing_slice):
+    "The shape of an array of the given shape after indexing by trailing_slice"
+    sliced = [len(range(*s.indices(length))) for s, length in zip(trailing_slice, shape)]
+    return (*sliced, *shape[len(trailing_slice):])
+
+
+@functools.lru_cache(maxsize=None)
+def _read_many_accepts_slice(read_many):
+    try:
+        return "slice" in inspect.signature(read_many).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def _accepts_slice(read_many):
+    "Whether a handler's read_many method (or None) takes a slice argument"
+    if read_many is None:
+        return False
+    # Look at the function, not the bound method, so that the answer is
+    # cached once per handler class.
+    return _read_many_accepts_slice(getattr(read_many, "__func__", read_many))
+
+
+def _read_datums(handler, resource, datums, retry_intervals):
+    """
+    Use the handler for resource to read the data referenced by datums.
+
+    Returns a list or array with one row per Datum.
+    """
+    if hasattr(handler, "read_many"):
+        # The handler can load all of these rows in one sweep,
+        # typically with a few large reads.
+        return _call_handler(
+            lambda: handler.read_many([datum["datum_kwargs"] for datum in datums]),
+            datums,
+            resource,
+            retry_intervals,
+        )
+    return [
+        _call_handler(
+            lambda: handler(**datum["datum_kwargs"]),
+            [datum],
+            resource,
+            retry_intervals,
+        )
+        for datum in datums
+    ]
+
+
+def _prefetch(items, depth):
+    """
+    Iterate over items in a background thread, up to depth items ahead.
+
+    The work of producing the next items overlaps with the caller's work on
+    the current one, while at most depth items are held in memory.
+    """
+    queue_ = queue.Queue(maxsize=depth)
+    closed = threading.Event()
+    done = object()
+
+    def put(item):
+        # Give up if the caller stops iterating while we wait for room.
+        while not closed.is_set():
+            try:
+                queue_.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+        except Exception as err:
+            put((done, err))
+        else:
+            put((done, None))
+
+    thread = threading.Thread(target=produce, name="databroker-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = queue_.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        closed.set()
+
+
+def _set_rows(column, length, start, values):
+    """
+    Write values into the rows of column from start on, allocating the column
+    on first use, as _set_row does.
+
+    values may be an array or a list of rows.
+    """
+    if not isinstance(values, numpy.ndarray):
+        for i, value in enumerate(values):
+            column = _set_row(column, length, start + i, numpy.asarray(value))
+        return column
+    if column is None:
+        column = numpy.empty((length, *values.shape[1:]), dtype=values.dtype)
+    elif values.dtype != column.dtype:
+        dtype = numpy.result_type(column.dtype, values.dtype)
+        if dtype != column.dtype:
+            column = column.astype(dtype)
+    column[start:start + len(values)] = values
+    return column
+
+
+def _set_row(column, length, row, value):
+    """
+    Write value into row of column, allocating the column on first use.
+
+    The column takes its dtype from the values, promoted as needed, just as
+    numpy.stack would.
+    """
+    if column is None:
+        column = numpy.empty((length, *value.shape), dtype=value.dtype)
+    elif value.dtype != column.dtype:
+        dtype = numpy.result_type(column.dtype, value.dtype)
+        if dtype != column.dtype:
+            column = column.astype(dtype)
+    column[row] = value
+    return column
+
+
+def _merge_event_pages(*streams):
+    """
+    Interleave the ("descriptor", doc) and ("event_page", doc) items of several
+    streams in time order.
+
+    The items of each stream must be in time order. EventPages are split
+    where needed so that the Events come out in time order overall.
+    """
+    iterators = [iter(stream) for stream in streams]
+    # One entry per stream: (time of next item, stream index, name, doc,
+    # index of the next row if doc is an EventPage)
+    heap = []
+
+    def advance(i):
+        item = next(iterators[i], None)
+        if item is not None:
+            name, doc = item
+            time_ = doc["time"][0] if name == "event_page" else doc["time"]
+            heapq.heappush(heap, (time_, i, name, doc, 0))
+
+    for i in range(len(iterators)):
+        advance(i)
+    while heap:
+        _, i, name, doc, start = heapq.heappop(heap)
+        if name != "event_page":
+            yield name, doc
+            advance(i)
+            continue
+        times = doc["time"]
+        if heap:
+            # Take the rows up to the next item from any other stream.
+            stop = max(start + 1, bisect.bisect_right(times, heap[0][0], lo=start))
+        else:
+            stop = len(times)
+        if (start == 0) and (stop == len(times)):
+            yield name, doc
+        else:
+            yield name, _slice_event_page(doc, start, stop)
+        if stop < len(times):
+            heapq.heappush(heap, (times[stop], i, name, doc, stop))
+        else:
+            advance(i)
+
+
+def _select_descriptor_fields(descriptor, fields):
+    "Return a copy of an Event Descriptor with only the given data keys."
+    data_keys = {
+        key: value for key, value in descriptor["data_keys"].items() if key in fields
+    }
+    selected = {**descriptor, "data_keys": data_keys}
+    if "object_keys" in descriptor:
+        selected["object_keys"] = {
+            object_name: [key for key in keys if key in data_keys]
+            for object_name, keys in descriptor["object_keys"].items()
+        }
+    return selected
+
+
+def _select_event_fields(event, keys):
+    "Return a copy of an Event with only the given data keys."
+    return {
+        **event,
+        "data": {key: event["data"][key] for key in keys if key in event["data"]},
+        "timestamps": {
+            key: event["timestamps"][key] for key in keys if key in event["timestamps"]
+        },
+        "filled": {
+            key: value for key, value in event.get("filled", {}).items() if key in keys
+        },
+    }
+
+
+def _slice_event_page(event_page, start, stop):
+    "Return an EventPage with the rows start:stop of event_page."
+    return {
+        **event_page,
+        "time": event_page["time"][start:stop],
+        "uid": event_page["uid"][start:stop],
+        "seq_num": event_page["seq_num"][start:stop],
+        **{
+            sub_dict: {key: column[start:stop] for key, column in event_page[sub_dict].items()}
+            for sub_dict in ("filled", "data", "timestamps")
+        },
+    }
 
 
 def batch_documents(singles, size):
@@ -2206,50 +3532,114 @@ class BadShapeMetadata(Exception):
 
 def default_validate_shape(key, data, expected_shape):
     """
-    Check that data.shape == expected.shape.
-
-    * If number of dimensions differ, raise BadShapeMetadata
-    * If any dimension is larger than expected, raise BadShapeMetadata.
-    * If some dimensions are smaller than expected,, pad "right" edge of each
-      dimension that falls short with NaN.
+    Check that data.shape == expected.shape, and reconcile small differences.
+
+    * If number of dimensions differ, raise BadShapeMetadata.
+    * If any dimension differs from the expected size by more than 2, raise
+      BadShapeMetadata.
+    * If some dimensions are up to 2 larger than expected, trim the "right"
+      edge of each.
+    * If some dimensions are up to 2 smaller than expected, pad the "right"
+      edge of each by repeating its last values (numpy.pad's "edge" mode).
     """
     if data.shape == expected_shape:
         return data
-    if len(data.shape) != len(expected_shape):
+    padding, trimming = _padding_and_trimming(key, data.shape, expected_shape)
+    # TODO Rethink this!
+    # We cannot do NaN because that does not work for integers
+    # and it is too late to change our mind about the data type.
+    padded = numpy.pad(data, padding, "edge")
+    padded_and_trimmed = padded[tuple(trimming)]
+    return padded_and_trimmed
+
+
+def default_validate_column_shape(key, rows, expected_shape):
+    """
+    Apply default_validate_shape to every row of a column.
+
+    Rather than padding or trimming rows one at a time, find the distinct
+    shapes among the rows and reconcile all of the rows with each shape in
+    one go.
+
+    Parameters
+    ----------
+    key : str
+    rows : numpy.ndarray or list
+        An array of rows, or a list of array-likes, one per row
+    expected_shape : tuple
+
+    Returns
+    -------
+    column : numpy.ndarray
+        Shaped (len(rows), *expected_shape)
+    """
+    expected_shape = tuple(expected_shape)
+    if isinstance(rows, numpy.ndarray):
+        rows_by_shape = {rows.shape[1:]: (slice(None), rows)}
+        dtype = rows.dtype
+    else:
+        arrays = [numpy.asarray(row) for row in rows]
+        indexes_by_shape = collections.defaultdict(list)
+        for i, array in enumerate(arrays):
+            indexes_by_shape[array.shape].append(i)
+        rows_by_shape = {
+            shape: (indexes, numpy.stack([arrays[i] for i in indexes]))
+            for shape, indexes in indexes_by_shape.items()
+        }
+        dtype = numpy.result_type(*{array.dtype for array in arrays}) if arrays else float
+    column = None
+    for shape, (indexes, stacked) in rows_by_shape.items():
+        if shape != expected_shape:
+            padding, trimming = _padding_and_trimming(key, shape, expected_shape)
+            # Leave the first dimension, which counts the rows, alone.
+            stacked = numpy.pad(stacked, [(0, 0), *padding], "edge")[
+                (slice(None), *trimming)
+            ]
+        if len(rows_by_shape) == 1:
+            return stacked
+        if column is None:
+            column = numpy.empty((len(rows), *expected_shape), dtype=dtype)
+        column[indexes] = stacked
+    if column is None:
+        return numpy.empty((0, *expected_shape), dtype=dtype)
+    return column
+
+
+def _padding_and_trimming(key, shape, expected_shape):
+    """
+    Work out how default_validate_shape reconciles shape with expected_shape.
+
+    Returns the padding, as for numpy.pad, and a tuple of slices that trims
+    the padded data to the expected shape. Raise BadShapeMetadata if they
+    are too different.
+    """
+    if len(shape) != len(expected_shape):
         # The number of dimensions are different; padding can't fix this.
         raise BadShapeMetadata(
             f"For data key {key} "
-            f"shape {data.shape} does not "
+            f"shape {shape} does not "
             f"match expected shape {expected_shape}."
         )
     # Pad at the "end" along any dimension that is too short.
     padding = []
     trimming = []
-    for actual, expected in zip(data.shape, expected_shape):
+    for actual, expected in zip(shape, expected_shape):
         margin = expected - actual
         # Limit how much padding or trimming we are willing to do.
         SOMEWHAT_ARBITRARY_LIMIT_OF_WHAT_IS_REASONABLE = 2
         if abs(margin) > SOMEWHAT_ARBITRARY_LIMIT_OF_WHAT_IS_REASONABLE:
             raise BadShapeMetadata(
                 f"For data key {key} "
-                f"shape {data.shape} does not "
+                f"shape {shape} does not "
                 f"match expected shape {expected_shape}."
             )
         if margin > 0:
             padding.append((0, margin))
-            trimming.append(slice(None, None))
-        elif margin < 0:
-            padding.append((0, 0))
-            trimming.append(slice(None))
-        else:  # margin == 0
+        else:
             padding.append((0, 0))
-            trimming.append(slice(None, None))
-        # TODO Rethink this!
-        # We cannot do NaN because that does not work for integers
-        # and it is too late to change our mind about the data type.
-        padded = numpy.pad(data, padding, "edge")
-        padded_and_trimmed = padded[tuple(trimming)]
-    return padded_and_trimmed
+        # Trim at the "end" along any dimension that is too long.
+        trimming.append(slice(None, expected))
+    return padding, tuple(trimming)
 
 
 def build_summary(run_start_doc, run_stop_doc, stream_names):
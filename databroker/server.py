@@ -1,13 +1,38 @@
 import json
 import msgpack
-from typing import Optional
+import numpy
+import os
+import re
+from typing import List, Optional, Union
 from jsonschema import ValidationError
 
+import event_model
 from event_model import DocumentNames, schema_validators
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 import pydantic
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import StreamingResponse
-from tiled.server.dependencies import SecureEntry
+from tiled.media_type_registration import compression_registry
+from tiled.queries import QueryValueError
+from tiled.server import schemas
+from tiled.server.authentication import get_current_principal
+from tiled.server.core import apply_search, construct_resource, json_or_msgpack, resolve_media_type
+from tiled.server.dependencies import SecureEntry, get_query_registry
+from tiled.server.utils import filter_for_access, get_base_url
+
+from . import _compression, _framing, _msgpack_arrays
+
+
+# Number of chunks of encoded documents to prepare in a background thread
+# ahead of the response writer in GET /documents. If 0, they are prepared
+# by the response writer as it goes.
+DOCUMENTS_QUEUE_DEPTH = int(os.getenv("DATABROKER_DOCUMENTS_QUEUE_DEPTH", "8"))
+# Join encoded documents into chunks of at least this many bytes, to send
+# many small documents per write.
+DOCUMENTS_CHUNK_BYTESIZE = int(os.getenv("DATABROKER_DOCUMENTS_CHUNK_BYTESIZE", "65536"))
+# Number of Events (or Datums) to write per EventPage (or DatumPage) in POST
+# /documents/bulk
+BULK_INSERT_BATCH_SIZE = int(os.getenv("DATABROKER_BULK_INSERT_BATCH_SIZE", "10000"))
 
 
 class NamedDocument(pydantic.BaseModel):
@@ -15,49 +40,269 @@ class NamedDocument(pydantic.BaseModel):
     doc: dict
 
 
+class RunLookup(pydantic.BaseModel):
+    # scan_ids, uids, and partial uids (strict, so that true is not scan_id 1)
+    keys: List[Union[pydantic.StrictInt, pydantic.StrictStr]]
+
+
 router = APIRouter()
 
 
+def _default(obj):
+    "Encode the numpy arrays that filled documents contain as lists."
+    if isinstance(obj, (numpy.ndarray, numpy.generic)):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def _streaming_response(request, chunks, media_type):
+    """
+    Stream chunks of bytes, compressed chunk by chunk if the client accepts it.
+
+    Media types that tiled's CompressionMiddleware, which wraps this route,
+    compresses itself are left to it. The chunks are coalesced, compressed,
+    and queued up to DOCUMENTS_QUEUE_DEPTH ahead by a background thread, so
+    that reading from the database overlaps with sending to the client.
+    """
+    from .mongo_normalized import _prefetch
+
+    accept_encoding = request.headers.get("Accept-Encoding", "")
+    base_media_type = media_type.split(";")[0]
+    encoding = _compression.negotiate(accept_encoding)
+    chunks = _coalesce(chunks, DOCUMENTS_CHUNK_BYTESIZE)
+    if (encoding is None) or (
+        set(compression_registry.encodings(base_media_type))
+        & _compression.accepted_encodings(accept_encoding)
+    ):
+        headers = {}
+    else:
+        chunks = _compression.compress(chunks, encoding)
+        headers = {"Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+    if DOCUMENTS_QUEUE_DEPTH > 0:
+        chunks = _prefetch(chunks, DOCUMENTS_QUEUE_DEPTH)
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+
+def _coalesce(chunks, bytesize):
+    "Join consecutive chunks of bytes into chunks of at least bytesize bytes."
+    buffer = []
+    buffer_bytesize = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffer_bytesize += len(chunk)
+        if buffer_bytesize >= bytesize:
+            yield b"".join(buffer)
+            buffer.clear()
+            buffer_bytesize = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
 @router.get("/documents/{path:path}", response_model=NamedDocument)
 @router.get("/documents", response_model=NamedDocument, include_in_schema=False)
 def get_documents(
     request: Request,
     fill: Optional[bool] = False,
+    stream: Optional[List[str]] = Query(None),
+    field: Optional[List[str]] = Query(None),
+    resume_after: Optional[List[str]] = Query(None),
     run=SecureEntry(scopes=["read:data", "read:metadata"]),
 ):
+    """
+    Stream the documents of a run.
+
+    Optionally, include only the Events of some streams (``stream=...``),
+    only some fields of the Events (``field=...``), or only the Events
+    after a given seq_num of a stream (``resume_after=<stream>:<seq_num>``),
+    to pick up where an interrupted request left off. Each of these may be
+    given more than once.
+    """
 
     from .mongo_normalized import BlueskyRun
 
     if not isinstance(run, BlueskyRun):
         raise HTTPException(status_code=404, detail="This is not a BlueskyRun.")
+    for stream_name in stream or []:
+        if stream_name not in run:
+            raise HTTPException(status_code=404, detail=f"No stream named {stream_name!r}")
+    cursor = {}
+    for item in resume_after or []:
+        stream_name, separator, seq_num = item.rpartition(":")
+        try:
+            if not separator:
+                raise ValueError
+            cursor[stream_name] = int(seq_num)
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Expected resume_after=<stream>:<seq_num>, not {item!r}",
+            )
+    documents_kwargs = {
+        "fill": fill,
+        "stream_names": stream,
+        "fields": field,
+        "resume_after": cursor,
+    }
     DEFAULT_MEDIA_TYPE = "application/json-seq"
-    media_types = request.headers.get("Accept", DEFAULT_MEDIA_TYPE).split(", ")
+    media_types = request.headers.get("Accept", DEFAULT_MEDIA_TYPE).split(",")
     for media_type in media_types:
+        media_type, *parameters = [part.strip() for part in media_type.split(";")]
         if media_type == "*/*":
             media_type = DEFAULT_MEDIA_TYPE
         if media_type == "application/x-msgpack":
             # (name, doc) pairs as msgpack
+            # If asked, send numpy arrays, and the columns of EventPages, as
+            # raw buffers in a msgpack extension type.
+            use_arrays = "ext=numpy" in parameters
 
             def generator_func():
-                packer = msgpack.Packer()
-                for name, doc in run.documents(fill=fill):
+                if use_arrays:
+                    packer = msgpack.Packer(default=_msgpack_arrays.default)
+                else:
+                    packer = msgpack.Packer(default=_default)
+                for name, doc in run.documents(**documents_kwargs):
+                    if use_arrays and (name == "event_page"):
+                        doc = _msgpack_arrays.as_arrays(doc)
                     yield packer.pack({"name": name, "doc": doc})
 
             generator = generator_func()
-            return StreamingResponse(
-                generator, media_type="application/x-msgpack"
+            return _streaming_response(
+                request,
+                generator,
+                media_type=_msgpack_arrays.MEDIA_TYPE if use_arrays else "application/x-msgpack",
             )
         if media_type == "application/json-seq":
             # (name, doc) pairs as newline-delimited JSON
-            generator = (json.dumps({"name": name, "doc": doc}) + "\n" for name, doc in run.documents(fill=fill))
-            return StreamingResponse(
-                generator, media_type="application/json-seq"
+            generator = (
+                (json.dumps({"name": name, "doc": doc}, default=_default) + "\n").encode()
+                for name, doc in run.documents(**documents_kwargs)
+            )
+            return _streaming_response(
+                request, generator, media_type="application/json-seq"
             )
     else:
         raise HTTPException(
             status_code=406,
+            detail=", ".join(
+                ["application/json-seq", "application/x-msgpack", _msgpack_arrays.MEDIA_TYPE]
+            ),
+        )
+
+
+@router.post("/documents/bulk/{path:path}")
+@router.post("/documents/bulk", include_in_schema=False)
+async def post_documents_bulk(
+    request: Request,
+    catalog=SecureEntry(scopes=["write:data", "write:metadata"]),
+):
+    """
+    Insert a stream of documents, sent as json-seq or msgpack (name, doc) pairs.
+
+    EventPages and DatumPages are validated as whole pages, and Events and
+    Datums are written in batches of up to BULK_INSERT_BATCH_SIZE, in the
+    order received. If a document is invalid, the ones before it are
+    written, and the error says which one it was.
+    """
+    from .mongo_normalized import MongoAdapter
+
+    if not isinstance(catalog, MongoAdapter):
+        raise HTTPException(status_code=404, detail="This is not a CatalogOfBlueskyRuns.")
+    media_type, *_ = request.headers.get("Content-Type", "").split(";")
+    if media_type.strip() == "application/json-seq":
+        decoder = _framing.JSONSeqDecoder()
+    elif media_type.strip() == "application/x-msgpack":
+        decoder = _framing.MsgpackDecoder()
+    else:
+        raise HTTPException(
+            status_code=415,
             detail=", ".join(["application/json-seq", "application/x-msgpack"]),
         )
+    writer = _BulkWriter(catalog)
+    try:
+        async for chunk in request.stream():
+            try:
+                items = list(decoder.feed(chunk))
+            except ValueError as err:
+                raise HTTPException(status_code=400, detail=f"Could not decode stream: {err}")
+            # Validate and write in a thread, as pymongo blocks.
+            await run_in_threadpool(writer.extend, items)
+        try:
+            items = decoder.close()
+        except ValueError as err:
+            raise HTTPException(status_code=400, detail=str(err))
+        await run_in_threadpool(writer.extend, items)
+    except HTTPException as err:
+        # Write the valid documents that came before the invalid one, too.
+        try:
+            await run_in_threadpool(writer.flush)
+        except Exception as flush_err:
+            raise flush_err from err
+        raise
+    await run_in_threadpool(writer.flush)
+    return {"documents": writer.count}
+
+
+class _BulkWriter:
+    """
+    Validate documents and write them to a catalog in the order received.
+
+    Consecutive Events of one descriptor (including those unpacked from
+    EventPages) are held back and written together as an EventPage of up to
+    BULK_INSERT_BATCH_SIZE, and likewise consecutive Datums of one Resource
+    as a DatumPage. Any other document first flushes those held back, so
+    that, for example, a Stop document is written after the Events that
+    precede it.
+    """
+
+    def __init__(self, catalog):
+        self._serializer = catalog.get_serializer()
+        # ("event_page", descriptor uid) or ("datum_page", resource uid)
+        self._pending_key = None
+        self._pending = []
+        self.count = 0
+
+    def extend(self, items):
+        for item in items:
+            try:
+                name = DocumentNames(item["name"])
+                doc = event_model.sanitize_doc(item["doc"])
+                schema_validators[name].validate(doc)
+            except (KeyError, TypeError, ValueError, ValidationError) as err:
+                detail = getattr(err, "message", str(err))
+                raise HTTPException(
+                    status_code=400, detail=f"Document {self.count} is invalid: {detail}"
+                )
+            if name == DocumentNames.event_page:
+                self._hold("event_page", doc["descriptor"], event_model.unpack_event_page(doc))
+            elif name == DocumentNames.event:
+                self._hold("event_page", doc["descriptor"], [doc])
+            elif name == DocumentNames.datum_page:
+                self._hold("datum_page", doc["resource"], event_model.unpack_datum_page(doc))
+            elif name == DocumentNames.datum:
+                self._hold("datum_page", doc["resource"], [doc])
+            else:
+                self.flush()
+                self._serializer(name.value, doc)
+            self.count += 1
+
+    def _hold(self, page_name, key, docs):
+        if (page_name, key) != self._pending_key:
+            self.flush()
+            self._pending_key = (page_name, key)
+        self._pending.extend(docs)
+        if len(self._pending) >= BULK_INSERT_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        page_name, _ = self._pending_key
+        if page_name == "event_page":
+            page = event_model.pack_event_page(*self._pending)
+        else:
+            page = event_model.pack_datum_page(*self._pending)
+        self._pending.clear()
+        self._serializer(page_name, page)
 
 
 @router.post("/documents/{path:path}")
@@ -78,3 +323,70 @@ def post_documents(
     except ValidationError as err:
         raise HTTPException(status_code=400, detail=err.message)
     serializer(named_doc.name.value, named_doc.doc)
+
+
+_FILTER_PARAM = re.compile(r"filter\[(?P<name>.+)\]\[condition\]\[(?P<field>.+)\]")
+
+
+@router.post("/runs/lookup/{path:path}")
+@router.post("/runs/lookup", include_in_schema=False)
+async def lookup_runs(
+    request: Request,
+    lookup: RunLookup,
+    path: str = "",
+    include_data_sources: bool = Query(False),
+    catalog=SecureEntry(scopes=["read:metadata"]),
+    principal=Depends(get_current_principal),
+    query_registry=Depends(get_query_registry),
+):
+    """
+    Look up many runs by scan_id, uid, or partial uid, in one query.
+
+    The keys are interpreted as CatalogOfBlueskyRuns.__getitem__ does, and
+    looked up within the search results given by any filter[...] parameters,
+    as in GET /search. The response has an item for each key, as GET
+    /metadata would give, or null where there is no match.
+
+    The items are built with tiled's own server internals (apply_search,
+    filter_for_access, construct_resource), as tiled's GET /search route
+    builds them. Those are not a stable API, so the tiled version is pinned
+    in requirements-server.txt, and test_lookup_runs_tiled_internals checks
+    that they still have the signatures used here.
+    """
+    from .mongo_normalized import MongoAdapter
+
+    filters = {}
+    for param, value in request.query_params.multi_items():
+        match = _FILTER_PARAM.fullmatch(param)
+        if match is not None:
+            filters.setdefault(f"filter___{match['name']}___{match['field']}", []).append(value)
+    catalog = filter_for_access(catalog, principal, ["read:metadata"], request.state.metrics)
+    catalog = await apply_search(catalog, filters, query_registry)
+    if not isinstance(catalog, MongoAdapter):
+        raise HTTPException(status_code=404, detail="This is not a CatalogOfBlueskyRuns.")
+    try:
+        runs = await run_in_threadpool(catalog.lookup, lookup.keys)
+    except QueryValueError as err:
+        raise HTTPException(status_code=400, detail=err.args[0])
+    base_url = get_base_url(request)
+    path_parts = [segment for segment in path.split("/") if segment]
+    media_type = resolve_media_type(request)
+    data = []
+    for key in lookup.keys:
+        run = runs.get(key)
+        if run is None:
+            data.append(None)
+            continue
+        resource = await construct_resource(
+            base_url=base_url,
+            path_parts=path_parts + [run.metadata()["start"]["uid"]],
+            entry=run,
+            fields=list(schemas.EntryFields),
+            select_metadata=None,
+            omit_links=False,
+            include_data_sources=include_data_sources,
+            media_type=media_type,
+            max_depth=None,
+        )
+        data.append(resource.model_dump())
+    return json_or_msgpack(request, {"data": data})
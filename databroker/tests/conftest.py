@@ -11,8 +11,12 @@ import tempfile
 import shutil
 import tzlocal
 import databroker.headersource.mongoquery as mqmds
+from bluesky import RunEngine
+from tiled.client import Context, from_context
+from tiled.server.app import build_app
 
 from ..headersource import sqlite as sqlmds
+from ..mongo_normalized import MongoAdapter
 
 if sys.version_info >= (3, 5):
     # this is a pytest.fixture
@@ -106,6 +110,34 @@ def mds_portable(request):
     return mds
 
 
+@pytest.fixture
+def mongo_adapter(request):
+    '''Provide a MongoAdapter backed by mongomock.
+
+    Parametrize it indirectly with a dict of arguments for from_mongomock:
+
+    >>> @pytest.mark.parametrize('mongo_adapter', [{'column_cache_size': 0}],
+    ...                          indirect=True)
+    '''
+    return MongoAdapter.from_mongomock(**getattr(request, 'param', {}))
+
+
+@pytest.fixture
+def mongo_client(mongo_adapter, tmpdir):
+    "Provide a tiled client of mongo_adapter, served in process."
+    with Context.from_app(build_app(mongo_adapter),
+                          token_cache=tmpdir) as context:
+        yield from_context(context)
+
+
+@pytest.fixture
+def mongo_RE(mongo_client):
+    "Provide a RunEngine that posts its documents to mongo_client."
+    run_engine = RunEngine()
+    run_engine.subscribe(mongo_client.post_document)
+    return run_engine
+
+
 SIM_DETECTORS = {'scalar': 'det',
                  'image': 'direct_img',
                  'external_image': 'img'}
@@ -0,0 +1,224 @@
+"""
+Benchmarks that compare optimized code paths against their baselines.
+
+These print their measurements; run them with ``pytest -s`` to see them.
+They are skipped unless the environment variable DATABROKER_BENCHMARKS is
+set. Those that need a MongoDB server look for one on localhost:27017 and
+are skipped if it is not running.
+"""
+import json
+import os
+import time
+import uuid
+
+import bson
+from bson.raw_bson import RawBSONDocument
+import event_model
+import numpy
+import pymongo
+import pytest
+import suitcase.mongo_normalized
+from tiled.client import Context, from_context
+from tiled.server.app import build_app
+
+from .. import _compression, _framing, _msgpack_arrays, mongo_normalized
+from .._bson_columns import decode_array, field_offsets
+from ..mongo_normalized import MongoAdapter
+
+
+def _time(func, repeat=3):
+    "Return the best wall time of func() over a few attempts."
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+requires_opt_in = pytest.mark.skipif(
+    not os.getenv("DATABROKER_BENCHMARKS"),
+    reason="Set DATABROKER_BENCHMARKS=1 to run benchmarks",
+)
+
+
+@pytest.fixture
+def mongo_uri():
+    client = pymongo.MongoClient("localhost", 27017, serverSelectionTimeoutMS=1_000)
+    try:
+        client.server_info()
+    except pymongo.errors.ServerSelectionTimeoutError:
+        pytest.skip("No MongoDB server running on localhost:27017")
+    database_name = f"databroker_benchmark_disposable_{uuid.uuid4()}"
+    yield f"mongodb://localhost:27017/{database_name}"
+    client.drop_database(database_name)
+
+
+def _insert_synthetic_run(uri, num_events, num_fields=4, page_size=10_000):
+    "Insert a run with one stream of scalar fields directly via suitcase-mongo."
+    database = mongo_normalized._get_database(uri)
+    serializer = suitcase.mongo_normalized.Serializer(database, database)
+    serializer.create_indexes()
+    bundle = event_model.compose_run()
+    serializer("start", bundle.start_doc)
+    data_keys = {
+        f"x{i}": {"source": "synthetic", "dtype": "number", "shape": []}
+        for i in range(num_fields)
+    }
+    descriptor_bundle = bundle.compose_descriptor(data_keys=data_keys, name="primary")
+    serializer("descriptor", descriptor_bundle.descriptor_doc)
+    for start in range(0, num_events, page_size):
+        stop = min(start + page_size, num_events)
+        n = stop - start
+        now = time.time()
+        values = numpy.random.random((num_fields, n)).tolist()
+        serializer(
+            "event_page",
+            descriptor_bundle.compose_event_page(
+                data={key: column for key, column in zip(data_keys, values)},
+                timestamps={key: [now] * n for key in data_keys},
+                seq_num=list(range(1 + start, 1 + stop)),
+                time=[now + i * 1e-6 for i in range(start, stop)],
+                validate=False,
+            ),
+        )
+    serializer("stop", bundle.compose_stop())
+    return bundle.start_doc["uid"]
+
+
+@requires_opt_in
+def test_benchmark_concurrent_page_fetching(mongo_uri, monkeypatch):
+    # Small pages stand in for a much larger stream fetched in 10 MB pages.
+    monkeypatch.setattr(mongo_normalized, "TARGET_PAGE_BYTESIZE", 500_000)
+    uid = _insert_synthetic_run(mongo_uri, num_events=500_000)
+    timings = {}
+    results = {}
+    for concurrency in [1, 8]:
+        adapter = MongoAdapter.from_uri(
+            mongo_uri, page_fetch_concurrency=concurrency, column_cache_size=0
+        )
+        dataset = adapter[uid]["primary"]["data"]
+
+        def read():
+            results[concurrency] = dataset.read()
+
+        timings[concurrency] = _time(read)
+    for key in ["time", "x0", "x3"]:
+        numpy.testing.assert_array_equal(results[1][key].read(), results[8][key].read())
+    print(
+        f"\nConcurrent page fetching: serial {timings[1]:.3f} s, "
+        f"8 threads {timings[8]:.3f} s, speedup {timings[1] / timings[8]:.1f}x"
+    )
+
+
+@requires_opt_in
+def test_benchmark_bson_column_decoding():
+    num_rows = 100_000
+    raw = bson.encode({"_id": "abc", "x": numpy.random.random((num_rows, 8)).tolist()})
+
+    def via_lists():
+        return numpy.stack(bson.decode(raw)["x"])
+
+    def via_raw_bson():
+        _, offset = field_offsets(RawBSONDocument(raw).raw)["x"]
+        return decode_array(raw, offset, (8,), num_rows)
+
+    numpy.testing.assert_array_equal(via_lists(), via_raw_bson())
+    lists, direct = _time(via_lists), _time(via_raw_bson)
+    print(
+        f"\nBSON column decoding: via lists {lists:.3f} s, "
+        f"direct {direct:.3f} s, speedup {lists / direct:.1f}x"
+    )
+
+
+@requires_opt_in
+def test_benchmark_documents_compression(mongo_uri, tmpdir):
+    num_events = 100_000
+    uid = _insert_synthetic_run(mongo_uri, num_events=num_events)
+    adapter = MongoAdapter.from_uri(mongo_uri)
+    with Context.from_app(build_app(adapter), token_cache=tmpdir) as context:
+        client = from_context(context)
+        link = client[uid].item["links"]["self"].replace("/metadata", "/documents", 1)
+        print(
+            f"\n/documents for {num_events} Events: media type, encoding, "
+            "MB on the wire, MB decoded, s, Events/s"
+        )
+        for media_type in ["application/json-seq", _msgpack_arrays.MEDIA_TYPE]:
+            for encoding in ["identity", *_compression.ENCODINGS]:
+                sizes = {}
+
+                def fetch():
+                    with context.http_client.stream(
+                        "GET",
+                        link,
+                        headers={"Accept": media_type, "Accept-Encoding": encoding},
+                    ) as response:
+                        content_encoding = response.headers.get("Content-Encoding")
+                        assert content_encoding == (None if encoding == "identity" else encoding)
+                        wire = decoded = 0
+                        raw_chunks = response.iter_raw()
+
+                        def counted():
+                            nonlocal wire
+                            for chunk in raw_chunks:
+                                wire += len(chunk)
+                                yield chunk
+
+                        for chunk in _compression.decompress(counted(), content_encoding):
+                            decoded += len(chunk)
+                    sizes["wire"], sizes["decoded"] = wire, decoded
+
+                duration = _time(fetch)
+                print(
+                    f"{media_type:35} {encoding:9} {sizes['wire'] / 1e6:7.1f} "
+                    f"{sizes['decoded'] / 1e6:7.1f} {duration:7.3f} {num_events / duration:10.0f}"
+                )
+
+
+@requires_opt_in
+def test_benchmark_client_documents_decoding(mongo_uri, tmpdir, monkeypatch):
+    num_events = 100_000
+    uid = _insert_synthetic_run(mongo_uri, num_events=num_events)
+    # Send many small EventPages, the hard case for decoding.
+    monkeypatch.setattr(mongo_normalized, "TARGET_EVENT_PAGE_BYTESIZE", 1_000)
+    adapter = MongoAdapter.from_uri(mongo_uri)
+    with Context.from_app(build_app(adapter), token_cache=tmpdir) as context:
+        client = from_context(context)
+        run = client[uid]
+        link = run.item["links"]["self"].replace("/metadata", "/documents", 1)
+        with context.http_client.stream(
+            "GET",
+            link,
+            headers={"Accept": "application/json-seq", "Accept-Encoding": "identity"},
+        ) as response:
+            chunks = list(response.iter_bytes())
+
+        def via_string_tail():
+            # the approach that JSONSeqDecoder replaced
+            items = []
+            tail = ""
+            for chunk in chunks:
+                for line in chunk.decode().splitlines(keepends=True):
+                    if line[-1] == "\n":
+                        items.append(json.loads(tail + line))
+                        tail = ""
+                    else:
+                        tail += line
+            return items
+
+        def via_decoder():
+            decoder = _framing.JSONSeqDecoder()
+            items = []
+            for chunk in chunks:
+                items.extend(decoder.feed(chunk))
+            items.extend(decoder.close())
+            return items
+
+        assert via_string_tail() == via_decoder()
+        baseline, decoder = _time(via_string_tail), _time(via_decoder)
+        end_to_end = _time(lambda: list(run.documents()), repeat=1)
+    print(
+        f"\nClient json-seq decoding of {len(chunks)} chunks: string tail {baseline:.3f} s, "
+        f"decoder {decoder:.3f} s, speedup {baseline / decoder:.1f}x; "
+        f"run.documents() end to end {end_to_end:.3f} s"
+    )
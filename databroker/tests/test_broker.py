@@ -654,10 +654,11 @@ def test_external_access_with_handler(db, RE, hw):
 
     EXPECTED_SHAPE = (10, 10)  # via ophyd.sim.img
 
-    # Fetching filled events is no longer supported.
+    # Filled events are filled by the server.
     if hasattr(db, 'v1') or hasattr(db, 'v2'):
-        with pytest.raises(NotImplementedError):
-            next(db.get_events(h, fields=['img'], fill=True))
+        ev = next(db.get_events(h, fields=['img'], fill=True))
+        assert np.asarray(ev['data']['img']).shape == EXPECTED_SHAPE
+        assert ev['filled']['img']
 
     ev, ev2 = db.get_events(h, fields=['img'])
     assert ev is not ev2
@@ -1070,8 +1071,13 @@ def test_fill_and_multiple_streams(db, RE, tmpdir, hw):
 
     h = db[uid]
     if hasattr(db, 'v1') or hasattr(db, 'v2'):
-        with pytest.raises(NotImplementedError):
-            list(h.documents(stream_name=ALL, fill=True))
+        # The server fills the documents.
+        for name, doc in h.documents(stream_name=ALL, fill=True):
+            if name == 'event':
+                for key in ['detfs1', 'detfs2']:
+                    if key in doc['data']:
+                        assert np.asarray(doc['data'][key]).shape == (5, 5)
+                        assert doc['filled'][key]
         list(h.documents(stream_name=ALL, fill=False))
 
 
@@ -0,0 +1,111 @@
+import bson
+from bson.raw_bson import RawBSONDocument
+import numpy
+import pytest
+from bluesky import RunEngine
+from bluesky.plans import count
+from ophyd.sim import det, img
+from tiled.client import Context, from_context
+from tiled.server.app import build_app
+
+from .. import mongo_normalized
+from .._bson_columns import decode_array, field_offsets
+from ..mongo_normalized import MongoAdapter, _decode_columns
+
+
+def _decode(rows, row_shape, max_rows=None, dtype=None):
+    raw = bson.encode({"_id": "abc", "x": rows, "after": 1.0})
+    _, offset = field_offsets(raw)["x"]
+    return decode_array(raw, offset, row_shape, max_rows or len(rows), dtype)
+
+
+@pytest.mark.parametrize(
+    "rows, row_shape, dtype",
+    [
+        ([1.5, -2.5] * 60, (), "float64"),
+        ([True, False] * 7, (), "bool"),
+        # Small ints are encoded as int32, large ones as int64; both become int64.
+        (list(range(105)), (), "int64"),
+        ([2**40] * 11, (), "int64"),
+        ([[[i + 0.5, i + 1.0], [2.0, 3.0]] for i in range(123)], (2, 2), "float64"),
+        ([[float(i)] * 11 for i in range(3)], (11,), "float64"),
+    ],
+)
+def test_decode_array(rows, row_shape, dtype):
+    actual = _decode(rows, row_shape, max_rows=len(rows) + 7)
+    assert actual is not None
+    assert actual.dtype == numpy.dtype(dtype)
+    numpy.testing.assert_array_equal(actual, numpy.array(rows))
+
+
+@pytest.mark.parametrize(
+    "rows, row_shape",
+    [
+        # mixed types
+        ([1.0, 2, 3.0], ()),
+        (["a", "b"], ()),
+        ([None, 1.0], ()),
+        # ragged
+        ([[1.0, 2.0], [1.0]], (2,)),
+        # shape not as declared
+        ([[1.0, 2.0], [1.0, 2.0]], (3,)),
+        ([1.0, 2.0], (1,)),
+        ([[1.0], [2.0]], ()),
+        ([{"a": 1.0}], ()),
+    ],
+)
+def test_decode_array_gives_up(rows, row_shape):
+    assert _decode(rows, row_shape) is None
+
+
+def test_decode_array_dtype():
+    actual = _decode([1, 2, 3], (), dtype=numpy.dtype("float64"))
+    assert actual.dtype == numpy.dtype("float64")
+    numpy.testing.assert_array_equal(actual, [1, 2, 3])
+    # Do not silently truncate floats into an integer column.
+    assert _decode([1.5, 2.0], (), dtype=numpy.dtype("int64")) is None
+
+
+def test_decode_columns():
+    doc = {"_id": "abc", "x": [1.0, 2.0], "y": ["a", "b"], "z": [3.0, 4.0]}
+    layouts = {"x": ((), numpy.dtype("float64")), "y": ((), numpy.dtype("float64")), "z": None}
+    columns = _decode_columns(RawBSONDocument(bson.encode(doc)), layouts, 2)
+    assert isinstance(columns["x"], numpy.ndarray)
+    assert columns["y"] == ["a", "b"]
+    assert columns["z"] == [3.0, 4.0]
+    # A decoded document falls back to lists.
+    columns = _decode_columns(doc, layouts, 2)
+    assert columns == {"x": [1.0, 2.0], "y": ["a", "b"], "z": [3.0, 4.0]}
+
+
+class RawCollection:
+    "Stand in for a pymongo collection configured to return RawBSONDocuments"
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def aggregate(self, *args, **kwargs):
+        for doc in self._collection.aggregate(*args, **kwargs):
+            yield RawBSONDocument(bson.encode(doc))
+
+
+def test_read_columns_from_raw_bson(tmpdir, monkeypatch):
+    adapter = MongoAdapter.from_mongomock(column_cache_size=0)
+
+    with Context.from_app(build_app(adapter), token_cache=tmpdir) as context:
+        client = from_context(context)
+
+        def post_document(name, doc):
+            client.post_document(name, doc)
+
+        RE = RunEngine()
+        RE.subscribe(post_document)
+        (uid,) = RE(count([det, img], 7))
+
+    expected = adapter[uid]["primary"]["data"].read()
+    monkeypatch.setattr(mongo_normalized, "_raw_bson_collection", RawCollection)
+    adapter._clear_from_cache(uid)
+    actual = adapter[uid]["primary"]["data"].read()
+    for key in ["time", "det", "img"]:
+        numpy.testing.assert_array_equal(actual[key].read(), expected[key].read())
+    assert actual["img"].read().shape == (7, 10, 10)
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from .._compression import ENCODINGS, compress, decompress, negotiate
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_each_chunk_decodes_on_arrival(encoding):
+    chunks = [os.urandom(10) + b"abc" * i for i in range(1, 30)]
+    compressed = list(compress(iter(chunks), encoding))
+    # Everything sent so far can be decoded, without waiting for the end.
+    for i in range(1, len(chunks)):
+        assert b"".join(decompress(compressed[:i], encoding)) == b"".join(chunks[:i])
+    # The stream may be split anywhere on the way.
+    raw = b"".join(compressed)
+    pieces = [raw[i:i + 7] for i in range(0, len(raw), 7)]
+    assert b"".join(decompress(pieces, encoding)) == b"".join(chunks)
+
+
+def test_negotiate():
+    assert negotiate("gzip, deflate") == "gzip"
+    assert negotiate("br;q=1.0, gzip;q=0.5") == "gzip"
+    assert negotiate("identity") is None
+    assert negotiate("") is None
+    assert negotiate("zstd, gzip") == ENCODINGS[0]
+
+
+def test_identity():
+    assert list(decompress([b"a", b"b"], None)) == [b"a", b"b"]
+    with pytest.raises(ValueError):
+        list(decompress([b"a"], "compress"))
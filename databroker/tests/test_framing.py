@@ -0,0 +1,62 @@
+import json
+
+import msgpack
+import numpy
+import pytest
+
+from .. import _framing, _msgpack_arrays
+
+ITEMS = [{"name": "event", "doc": {"seq_num": i, "text": "x" * (i % 300)}} for i in range(500)]
+
+
+def _chunks(raw, size):
+    return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+
+@pytest.fixture(params=[True, False], ids=["orjson", "json"])
+def json_seq_decoder(request, monkeypatch):
+    if request.param:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(_framing, "orjson", None)
+    return _framing.JSONSeqDecoder()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000, 10**6])
+def test_json_seq(json_seq_decoder, chunk_size):
+    raw = b"".join(json.dumps(item).encode() + b"\n" for item in ITEMS)
+    # The last newline is optional.
+    raw = raw[:-1]
+    actual = []
+    for chunk in _chunks(raw, chunk_size):
+        actual.extend(json_seq_decoder.feed(chunk))
+    actual.extend(json_seq_decoder.close())
+    assert actual == ITEMS
+
+
+def test_json_seq_stop_partway(json_seq_decoder):
+    raw = b"".join(json.dumps(item).encode() + b"\n" for item in ITEMS)
+    # Stop iterating partway through a chunk, and move on to the next.
+    first = next(json_seq_decoder.feed(raw[:1000]))
+    rest = list(json_seq_decoder.feed(raw[1000:]))
+    assert [first, *rest] == ITEMS
+    json_seq_decoder.feed(raw[:-5])
+    with pytest.raises(ValueError):
+        json_seq_decoder.close()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000, 10**6])
+def test_msgpack(chunk_size):
+    items = [*ITEMS, {"name": "event_page", "doc": {"data": {"x": numpy.ones((3, 2))}}}]
+    packer = msgpack.Packer(default=_msgpack_arrays.default)
+    raw = b"".join(packer.pack(item) for item in items)
+    decoder = _framing.MsgpackDecoder()
+    actual = []
+    for chunk in _chunks(raw, chunk_size):
+        actual.extend(decoder.feed(chunk))
+    actual.extend(decoder.close())
+    assert actual[:-1] == ITEMS
+    numpy.testing.assert_array_equal(actual[-1]["doc"]["data"]["x"], numpy.ones((3, 2)))
+    decoder.feed(raw[:5])
+    with pytest.raises(ValueError):
+        decoder.close()
@@ -0,0 +1,841 @@
+import builtins
+import inspect
+import threading
+import time
+
+import event_model
+import numpy
+import pytest
+from bluesky import RunEngine
+from bluesky.plans import count
+from bluesky.preprocessors import SupplementalData
+from ophyd.sim import det, img
+from tiled.client.utils import ClientError
+from tiled.queries import Key
+
+from .. import client as client_module, mongo_normalized, server
+from ..mongo_normalized import ColumnCache, MongoAdapter, TARGET_PAGE_BYTESIZE, _plan_pages
+
+
+def test_plan_pages_packs_columns():
+    # Small columns all fit into one page together.
+    plan = _plan_pages({"a": 8, "b": 16, "c": 40_000}, 1, 101)
+    assert len(plan) == 1
+    ((keys, boundaries),) = plan
+    assert set(keys) == {"a", "b", "c"}
+    assert boundaries == [1, 101]
+
+    # A column too large to share a page gets a group of its own.
+    big = TARGET_PAGE_BYTESIZE - 4
+    plan = _plan_pages({"a": 8, "b": 16, "big": big}, 1, 11)
+    assert [set(keys) for keys, _ in plan] == [{"big"}, {"a", "b"}]
+    big_boundaries = plan[0][1]
+    assert big_boundaries == list(range(1, 12))
+
+    # Page size is chosen from the combined size of the group.
+    plan = _plan_pages({"a": TARGET_PAGE_BYTESIZE // 4}, 1, 10)
+    ((_, boundaries),) = plan
+    assert boundaries == [1, 5, 9, 10]
+
+
+def _adapter_with(**kwargs):
+    "Parametrize the mongo_adapter fixture with these from_mongomock arguments."
+    return pytest.mark.parametrize("mongo_adapter", [kwargs], indirect=True)
+
+
+def test_read_columns(mongo_adapter, mongo_client, mongo_RE):
+    (uid,) = mongo_RE(count([det, img], 7))
+    ds = mongo_client[uid]["primary"].read()
+    assert ds["det"].shape == (7,)
+    assert ds["img"].shape == (7, 10, 10)
+    assert ds["time"].shape == (7,)
+    # mongomock does not support $bsonSize, so the sizes recorded on the
+    # stream are guesses.
+    stream = mongo_adapter[uid]["primary"]
+    assert stream.row_bytesizes == {
+        "time": 8,
+        "data.det": 8,
+        "data.img": 8,
+        "timestamps.det": 8,
+    }
+
+
+class _StubRawCollection:
+    "Stand in for a pymongo Collection, which cannot be tested for truth."
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.calls = 0
+
+    def __bool__(self):
+        raise NotImplementedError("Collection objects do not implement truth value testing")
+
+    def aggregate(self, pipeline):
+        self.calls += 1
+        return self._collection.aggregate(pipeline)
+
+
+def test_read_columns_from_raw_collection(monkeypatch):
+    raw_collections = []
+
+    def raw_bson_collection(collection):
+        raw_collections.append(_StubRawCollection(collection))
+        return raw_collections[-1]
+
+    monkeypatch.setattr(mongo_normalized, "_raw_bson_collection", raw_bson_collection)
+    # Build the adapter here, after _raw_bson_collection is patched.
+    adapter = MongoAdapter.from_mongomock()
+    RE = RunEngine()
+    RE.subscribe(adapter.get_serializer())
+    (uid,) = RE(count([det], 5))
+    ds = adapter[uid]["primary"]["data"].read()
+    assert ds["det"].read().shape == (5,)
+    assert sum(raw_collection.calls for raw_collection in raw_collections) > 0
+
+
+@_adapter_with(column_cache_size=0)
+def test_concurrent_page_fetching(mongo_adapter, mongo_RE, monkeypatch):
+    # Use tiny pages so that each column is fetched in many pages.
+    monkeypatch.setattr(mongo_normalized, "TARGET_PAGE_BYTESIZE", 24)
+    adapter = mongo_adapter
+    (uid,) = mongo_RE(count([det], 17))
+
+    expected = adapter[uid]["primary"]["data"].read()
+    # Rebuild the run with concurrent page fetching enabled.
+    adapter.page_fetch_concurrency = 4
+    adapter._clear_from_cache(uid)
+    actual = adapter[uid]["primary"]["data"].read()
+    for key in ["time", "det"]:
+        numpy.testing.assert_array_equal(actual[key].read(), expected[key].read())
+    assert len(actual["time"].read()) == 17
+
+
+def test_column_cache_evicts_by_bytes():
+    cache = ColumnCache(maxsize=100)
+    cache.put_column("a", numpy.zeros(5))  # 40 bytes
+    cache.put_column("b", numpy.zeros(5))
+    assert cache.get_column("a") is not None
+    cache.put_column("c", numpy.zeros(5))  # evicts "b", the least recently used
+    assert cache.get_column("b") is None
+    assert cache.get_column("c") is not None
+    # Too large to cache at all
+    cache.put_column("d", numpy.zeros(20))
+    assert cache.get_column("d") is None
+    assert (cache.hits, cache.misses, cache.evictions) == (2, 2, 1)
+    assert cache.currsize == 80
+
+
+def test_column_cache(mongo_adapter, mongo_client, mongo_RE):
+    adapter = mongo_adapter
+    (uid,) = mongo_RE(count([det], 5))
+
+    # While the run is in progress, nothing is cached.
+    partial_uid = None
+
+    def post_partial(name, doc):
+        nonlocal partial_uid
+        if name == "start":
+            partial_uid = doc["uid"]
+        if name != "stop":
+            mongo_client.post_document(name, doc)
+
+    RE = RunEngine()
+    RE.subscribe(post_partial)
+    RE(count([det], 3))
+
+    cache = adapter.column_cache
+    adapter[partial_uid]["primary"]["data"].read()
+    assert (cache.hits, cache.misses, cache.currsize) == (0, 0, 0)
+
+    expected = adapter[uid]["primary"]["data"].read()
+    assert (cache.hits, cache.misses) == (0, 2)
+    actual = adapter[uid]["primary"]["data"].read()
+    assert (cache.hits, cache.misses) == (2, 2)
+    for key in ["time", "det"]:
+        numpy.testing.assert_array_equal(actual[key].read(), expected[key].read())
+    # The time column is shared with the timestamps.
+    adapter[uid]["primary"]["timestamps"].read(["time"])
+    assert cache.hits == 3
+
+
+def test_fused_time_data_and_timestamps(mongo_adapter, mongo_RE):
+    adapter = mongo_adapter
+    (uid,) = mongo_RE(count([det, img], 5))
+    stream = adapter[uid]["primary"]
+    pipelines = []
+    aggregate = adapter._event_collection.aggregate
+
+    def counting_aggregate(pipeline, *args, **kwargs):
+        # Count the pipelines that read columns, not those that measure sizes.
+        if any("$group" in stage for stage in pipeline):
+            pipelines.append(pipeline)
+        return aggregate(pipeline, *args, **kwargs)
+
+    adapter._event_collection.aggregate = counting_aggregate
+    try:
+        data = stream["data"].read()
+        # time, det, img, and the timestamps of det come from one pipeline.
+        assert len(pipelines) == 1
+        timestamps = stream["timestamps"].read(["time", "det"])
+        assert len(pipelines) == 1
+    finally:
+        del adapter._event_collection.aggregate
+    numpy.testing.assert_array_equal(timestamps["time"].read(), data["time"].read())
+    expected = [
+        event["timestamps"]["det"] for event in adapter._event_collection.find().sort("seq_num")
+    ]
+    numpy.testing.assert_array_equal(timestamps["det"].read(), expected)
+
+
+def test_sibling_columns_prefetched_only_where_read(mongo_adapter, mongo_RE):
+    (uid,) = mongo_RE(count([det], 5))
+    cache = mongo_adapter.column_cache
+    stream = mongo_adapter[uid]["primary"]
+
+    # The time and timestamps are never read in this range, so they are not
+    # fetched along with it.
+    stream["data"].get_columns(["det"], slices=(slice(1, 3),))
+    assert cache.currsize == 2 * 8
+
+    # They are read in the whole range.
+    stream["data"].get_columns(["det"], slices=None)
+    assert cache.currsize == 2 * 8 + 3 * 5 * 8
+    hits = cache.hits
+    stream["timestamps"].read(["time", "det"])
+    assert cache.hits == hits + 2
+
+
+def _insert_run_with_events(adapter, values, seq_nums):
+    serializer = adapter.get_serializer()
+    bundle = event_model.compose_run()
+    serializer("start", bundle.start_doc)
+    descriptor_bundle = bundle.compose_descriptor(
+        data_keys={"x": {"source": "test", "dtype": "number", "shape": []}}, name="primary"
+    )
+    serializer("descriptor", descriptor_bundle.descriptor_doc)
+    for i, (value, seq_num) in enumerate(zip(values, seq_nums)):
+        serializer(
+            "event",
+            descriptor_bundle.compose_event(
+                data={"x": value}, timestamps={"x": i}, seq_num=seq_num, time=i
+            ),
+        )
+    serializer("stop", bundle.compose_stop())
+    return bundle.start_doc["uid"], descriptor_bundle
+
+
+# Complete runs are not expected to change, so do not cache them here.
+@_adapter_with(column_cache_size=0)
+def test_repeated_seq_num(mongo_adapter):
+    adapter = mongo_adapter
+    uid, _ = _insert_run_with_events(adapter, [1.0, 2.0, 3.0, 20.0], [1, 2, 3, 2])
+    dataset = adapter[uid]["primary"]["data"]
+    assert dataset._has_duplicate_seq_nums
+    # The latest Event with a given seq_num wins.
+    numpy.testing.assert_array_equal(dataset.read()["x"].read(), [1.0, 20.0, 3.0])
+
+    uid, descriptor_bundle = _insert_run_with_events(adapter, [1.0, 2.0, 3.0], [1, 2, 3])
+    dataset = adapter[uid]["primary"]["data"]
+    assert not dataset._has_duplicate_seq_nums
+    numpy.testing.assert_array_equal(dataset.read()["x"].read(), [1.0, 2.0, 3.0])
+    # Events with a repeated seq_num added after the stream was inspected
+    # are noticed when the column is read.
+    adapter.get_serializer()(
+        "event",
+        descriptor_bundle.compose_event(
+            data={"x": 30.0}, timestamps={"x": 10}, seq_num=3, time=10
+        ),
+    )
+    numpy.testing.assert_array_equal(dataset.read(["x"])["x"].read(), [1.0, 2.0, 30.0])
+    assert dataset._has_duplicate_seq_nums
+
+
+@_adapter_with(column_cache_size=0)
+def test_read_columns_into_preallocated_array(mongo_adapter, monkeypatch):
+    # Use tiny pages so that each column is assembled from many pages.
+    monkeypatch.setattr(mongo_normalized, "TARGET_PAGE_BYTESIZE", 24)
+    adapter = mongo_adapter
+    uid, _ = _insert_run_with_events(adapter, [1, 2.5, 3, 4, 5], [1, 2, 3, 4, 5])
+    x = adapter[uid]["primary"]["data"].read(["x"])["x"].read()
+    numpy.testing.assert_array_equal(x, [1.0, 2.5, 3.0, 4.0, 5.0])
+    assert x.dtype == numpy.dtype("float64")
+    # A seq_num is missing, so there are fewer rows than seq_nums in range.
+    uid, _ = _insert_run_with_events(adapter, [1.0, 2.0, 4.0], [1, 2, 4])
+    x = adapter[uid]["primary"]["data"].read(["x"])["x"].read()
+    numpy.testing.assert_array_equal(x, [1.0, 2.0, 4.0])
+
+
+def test_iter_events_in_pages(mongo_adapter):
+    seq_nums = [1, 2, 3, 4, 5, 20, 21, 22, 1_000]
+    uid, _ = _insert_run_with_events(mongo_adapter, range(len(seq_nums)), seq_nums)
+    run = mongo_adapter[uid]
+    items = list(run["primary"].iter_descriptors_and_events(size=2))
+    assert [name for name, _ in items] == ["descriptor"] + ["event"] * len(seq_nums)
+    assert [doc["seq_num"] for _, doc in items[1:]] == seq_nums
+    names = [name for name, _ in run.documents(fill=False)]
+    assert names == ["start", "descriptor", "event_page", "stop"]
+
+
+class _CountingHandler:
+    instances = []
+
+    def __init__(self, resource_path, **resource_kwargs):
+        self.offset = resource_kwargs["offset"]
+        self.calls = 0
+        type(self).instances.append(self)
+
+    def __call__(self, index):
+        self.calls += 1
+        return numpy.full((2, 3), self.offset + index)
+
+
+@pytest.fixture(autouse=True)
+def _clear_handler_instances():
+    _CountingHandler.instances.clear()
+
+
+def _insert_run_with_external_data(adapter, num_resources, num_events):
+    serializer = adapter.get_serializer()
+    bundle = event_model.compose_run()
+    serializer("start", bundle.start_doc)
+    descriptor_bundle = bundle.compose_descriptor(
+        data_keys={
+            "x": {"source": "test", "dtype": "array", "shape": [2, 3], "external": "FILESTORE:"}
+        },
+        name="primary",
+        time=0,
+    )
+    serializer("descriptor", descriptor_bundle.descriptor_doc)
+    resource_bundles = []
+    for i in range(num_resources):
+        resource_bundle = bundle.compose_resource(
+            spec="COUNTING",
+            root="/",
+            resource_path=f"file{i}",
+            resource_kwargs={"offset": 100 * i},
+        )
+        serializer("resource", resource_bundle.resource_doc)
+        resource_bundles.append(resource_bundle)
+    expected = []
+    for i in range(num_events):
+        # Interleave the Resources.
+        resource_index, index = i % num_resources, i // num_resources
+        datum = resource_bundles[resource_index].compose_datum(datum_kwargs={"index": index})
+        serializer("datum", datum)
+        serializer(
+            "event",
+            descriptor_bundle.compose_event(
+                data={"x": datum["datum_id"]},
+                timestamps={"x": i},
+                filled={"x": False},
+                seq_num=1 + i,
+                time=i,
+            ),
+        )
+        expected.append(numpy.full((2, 3), 100 * resource_index + index))
+    serializer("stop", bundle.compose_stop())
+    return bundle.start_doc["uid"], numpy.stack(expected)
+
+
+@_adapter_with(handler_registry={"COUNTING": _CountingHandler})
+def test_fill_column_by_resource(mongo_adapter):
+    uid, expected = _insert_run_with_external_data(mongo_adapter, num_resources=3, num_events=10)
+    actual = mongo_adapter[uid]["primary"]["data"].read(["x"])["x"].read()
+    numpy.testing.assert_array_equal(actual, expected)
+    # One handler per Resource, each called once per row
+    assert [handler.calls for handler in _CountingHandler.instances] == [4, 3, 3]
+
+
+class _BatchCountingHandler(_CountingHandler):
+    def __init__(self, resource_path, **resource_kwargs):
+        super().__init__(resource_path, **resource_kwargs)
+        self.batches = 0
+
+    def read_many(self, datum_kwargs_list):
+        self.batches += 1
+        return numpy.stack(
+            [numpy.full((2, 3), self.offset + kwargs["index"]) for kwargs in datum_kwargs_list]
+        )
+
+
+@_adapter_with(handler_registry={"COUNTING": _BatchCountingHandler})
+def test_fill_column_with_read_many(mongo_adapter):
+    uid, expected = _insert_run_with_external_data(mongo_adapter, num_resources=3, num_events=10)
+    actual = mongo_adapter[uid]["primary"]["data"].read(["x"])["x"].read()
+    numpy.testing.assert_array_equal(actual, expected)
+    assert [handler.batches for handler in _CountingHandler.instances] == [1, 1, 1]
+    assert [handler.calls for handler in _CountingHandler.instances] == [0, 0, 0]
+
+
+class _StatefulHandler(_BatchCountingHandler):
+    "Like the HDF5 handlers, this is not safe to use from two threads at once."
+
+    def __init__(self, resource_path, **resource_kwargs):
+        super().__init__(resource_path, **resource_kwargs)
+        self._busy = False
+        self.threads = set()
+
+    def read_many(self, datum_kwargs_list):
+        assert not self._busy, "The handler is in use by another thread."
+        self._busy = True
+        try:
+            self.threads.add(threading.current_thread().name)
+            time.sleep(0.01)
+            return super().read_many(datum_kwargs_list)
+        finally:
+            self._busy = False
+
+
+@_adapter_with(handler_registry={"COUNTING": _StatefulHandler}, fill_concurrency=3)
+def test_concurrent_fill_column(mongo_adapter):
+    uid, expected = _insert_run_with_external_data(mongo_adapter, num_resources=2, num_events=10)
+    actual = mongo_adapter[uid]["primary"]["data"].read(["x"])["x"].read()
+    numpy.testing.assert_array_equal(actual, expected)
+    # Each Resource is read by one thread, in one batch, and the Resources
+    # are read concurrently.
+    assert [handler.batches for handler in _CountingHandler.instances] == [1, 1]
+    threads = [handler.threads for handler in _CountingHandler.instances]
+    assert all(len(names) == 1 for names in threads)
+    assert all(name.startswith("databroker-fill") for names in threads for name in names)
+
+
+@_adapter_with(handler_registry={"COUNTING": _CountingHandler}, fill_concurrency=4)
+def test_concurrent_fill_column_without_read_many(mongo_adapter):
+    # Handlers without read_many are called once per row, still in order.
+    uid, expected = _insert_run_with_external_data(mongo_adapter, num_resources=3, num_events=10)
+    actual = mongo_adapter[uid]["primary"]["data"].read(["x"])["x"].read()
+    numpy.testing.assert_array_equal(actual, expected)
+    assert [handler.calls for handler in _CountingHandler.instances] == [4, 3, 3]
+
+
+class _SlicingCountingHandler(_CountingHandler):
+    slices = []
+
+    def read_many(self, datum_kwargs_list, slice=None):
+        type(self).slices.append(slice)
+        rows = numpy.stack(
+            [
+                numpy.arange(6).reshape(2, 3) + self.offset + kwargs["index"]
+                for kwargs in datum_kwargs_list
+            ]
+        )
+        return rows[(builtins.slice(None), *(slice or ()))]
+
+    def __call__(self, index):
+        self.calls += 1
+        return numpy.arange(6).reshape(2, 3) + self.offset + index
+
+
+@_adapter_with(handler_registry={"COUNTING": _SlicingCountingHandler}, column_cache_size=0)
+def test_read_block_pushes_slice_down_to_handler(mongo_adapter):
+    _SlicingCountingHandler.slices.clear()
+    uid, _ = _insert_run_with_external_data(mongo_adapter, num_resources=2, num_events=6)
+    dataset = mongo_adapter[uid]["primary"]["data"]
+    expected = dataset.read_block("x", (0, 0, 0))
+    assert expected.shape == (6, 2, 3)
+    # Whole rows are read without a slice.
+    assert _SlicingCountingHandler.slices == [None, None]
+    for slice_, handler_slice in [
+        (
+            (builtins.slice(1, 4), builtins.slice(1, 2), builtins.slice(None, None, 2)),
+            (builtins.slice(1, 2, 1), builtins.slice(0, 3, 2)),
+        ),
+        (
+            (builtins.slice(None), builtins.slice(None), builtins.slice(2, 0)),
+            (builtins.slice(0, 2, 1), builtins.slice(2, 2, 1)),
+        ),
+        (builtins.slice(2, None), None),
+    ]:
+        _SlicingCountingHandler.slices.clear()
+        actual = dataset.read_block("x", (0, 0, 0), slice=slice_)
+        numpy.testing.assert_array_equal(actual, expected[slice_])
+        # The handlers were asked for only part of each row.
+        assert _SlicingCountingHandler.slices == [handler_slice] * 2
+
+
+@_adapter_with(handler_registry={"COUNTING": _CountingHandler}, column_cache_size=0)
+def test_read_block_slices_rows_from_handler(mongo_adapter):
+    # Handlers that cannot slice get sliced after the fact.
+    uid, _ = _insert_run_with_external_data(mongo_adapter, num_resources=2, num_events=6)
+    dataset = mongo_adapter[uid]["primary"]["data"]
+    slice_ = (builtins.slice(1, 4), builtins.slice(1, 2), builtins.slice(None, None, 2))
+    actual = dataset.read_block("x", (0, 0, 0), slice=slice_)
+    numpy.testing.assert_array_equal(actual, dataset.read_block("x", (0, 0, 0))[slice_])
+
+
+@_adapter_with(handler_registry={"COUNTING": _CountingHandler})
+def test_documents_resolve_datums_in_batches(mongo_adapter, monkeypatch):
+    uid, expected = _insert_run_with_external_data(mongo_adapter, num_resources=4, num_events=12)
+    run = mongo_adapter[uid]
+    queries = []
+    for collection in [run._resource_collection, run._datum_collection]:
+        for method in ["find", "find_one"]:
+
+            def counting(*args, _original=getattr(collection, method), **kwargs):
+                queries.append(args)
+                return _original(*args, **kwargs)
+
+            monkeypatch.setattr(collection, method, counting)
+    # Use small pages, so that the Datums are needed across several pages.
+    documents = list(run.single_documents(fill=False, size=2))
+    # Each Resource and Datum is yielded once, before the first Event that
+    # needs it, with a fixed number of queries per new Resource, not per Datum.
+    resource_uids = set()
+    datum_ids = set()
+    for name, doc in documents:
+        if name == "resource":
+            assert doc["uid"] not in resource_uids
+            resource_uids.add(doc["uid"])
+        elif name == "datum":
+            assert doc["resource"] in resource_uids
+            assert doc["datum_id"] not in datum_ids
+            datum_ids.add(doc["datum_id"])
+        elif name == "event":
+            assert doc["data"]["x"] in datum_ids
+    assert len(resource_uids) == 4
+    assert len(datum_ids) == 12
+    # The Events interleave the Resources, so the first two pages each find
+    # two Resources by the fast path, with one query for the Resources and
+    # one for all of their Datums. Later pages need none.
+    assert len(queries) == 4
+
+    # Filled Events carry the data.
+    monkeypatch.undo()
+    events = [doc for name, doc in run.single_documents(fill=True) if name == "event"]
+    numpy.testing.assert_array_equal(numpy.stack([event["data"]["x"] for event in events]), expected)
+
+
+@_adapter_with(handler_registry={"COUNTING": _CountingHandler})
+def test_documents_as_event_pages(mongo_adapter):
+    adapter = mongo_adapter
+    uid, _ = _insert_run_with_external_data(adapter, num_resources=2, num_events=6)
+    # Add a second stream, with Events interleaved in time with the first.
+    serializer = adapter.get_serializer()
+    descriptor_bundle = event_model.compose_descriptor(
+        start={"uid": uid},
+        streams={},
+        event_counters={},
+        data_keys={"y": {"source": "test", "dtype": "number", "shape": []}},
+        name="secondary",
+        time=0.4,
+    )
+    serializer("descriptor", descriptor_bundle.descriptor_doc)
+    for i, t in enumerate([0.5, 0.7, 4.5]):
+        serializer(
+            "event",
+            descriptor_bundle.compose_event(
+                data={"y": i}, timestamps={"y": t}, seq_num=1 + i, time=t
+            ),
+        )
+    run = adapter[uid]
+    expected = list(adapter._event_collection.find({}, {"_id": False}).sort("time"))
+    for size in [None, 2]:
+        documents = list(run.documents(fill=False, size=size))
+        names = [name for name, _ in documents]
+        assert names[0] == "start"
+        assert names[-1] == "stop"
+        events = []
+        datum_ids = set()
+        for name, doc in documents:
+            if name == "datum_page":
+                datum_ids.update(doc["datum_id"])
+            if name == "event_page":
+                if size is not None:
+                    assert len(doc["seq_num"]) <= size
+                # The Datums come before the Events that reference them.
+                assert set(doc["data"].get("x", [])) <= datum_ids
+                events.extend(event_model.unpack_event_page(doc))
+        assert events == expected
+        assert [event["time"] for event in events] == sorted(event["time"] for event in events)
+        assert names.count("resource") == 2
+        assert len(datum_ids) == 6
+
+
+def test_documents_with_filters_and_resume(mongo_client, mongo_RE):
+    mongo_RE.preprocessors.append(SupplementalData(baseline=[det]))
+    (uid,) = mongo_RE(count([det, img], 5))
+    run = mongo_client[uid]
+
+    def events(documents):
+        return [
+            event
+            for name, doc in documents
+            if name == "event_page"
+            for event in event_model.unpack_event_page(doc)
+        ]
+
+    documents = list(run.documents(stream_names=["primary"], fields=["det"]))
+    descriptors = [doc for name, doc in documents if name == "descriptor"]
+    assert [descriptor["name"] for descriptor in descriptors] == ["primary"]
+    assert list(descriptors[0]["data_keys"]) == ["det"]
+    assert [event["seq_num"] for event in events(documents)] == [1, 2, 3, 4, 5]
+    assert all(list(event["data"]) == ["det"] for event in events(documents))
+
+    # Resume partway through the primary stream, and from the start of
+    # the baseline stream.
+    documents = list(run.documents(resume_after={"primary": 3}))
+    assert [name for name, _ in documents][0] == "start"
+    assert [name for name, _ in documents][-1] == "stop"
+    seq_nums = {}
+    for event in events(documents):
+        seq_nums.setdefault(event["descriptor"], []).append(event["seq_num"])
+    assert sorted(seq_nums.values()) == [[1, 2], [4, 5]]
+
+
+@_adapter_with(handler_registry={"COUNTING": _BatchCountingHandler})
+def test_documents_filled(mongo_adapter, mongo_client, monkeypatch):
+    # Prefetch just one document ahead, so that the background thread
+    # spends most of its time waiting for room in the queue.
+    monkeypatch.setattr(mongo_normalized, "FILL_PREFETCH_DEPTH", 1)
+    adapter = mongo_adapter
+    uid, expected = _insert_run_with_external_data(adapter, num_resources=2, num_events=6)
+    run = adapter[uid]
+    unfilled = [doc for name, doc in run.documents(fill=False, size=2) if name == "event_page"]
+    filled = [doc for name, doc in run.documents(fill=True, size=2) if name == "event_page"]
+    assert len(filled) == 3
+    numpy.testing.assert_array_equal(
+        numpy.concatenate([page["data"]["x"] for page in filled]), expected
+    )
+    for unfilled_page, filled_page in zip(unfilled, filled):
+        assert unfilled_page["filled"]["x"] == [False, False]
+        assert filled_page["filled"]["x"] == unfilled_page["data"]["x"]
+    # One batch per Resource per page
+    assert sum(handler.batches for handler in _CountingHandler.instances) == 6
+
+    # Stopping early is fine.
+    documents = run.documents(fill=True, size=1)
+    next(documents)
+    documents.close()
+
+    filled = [doc for name, doc in mongo_client[uid].documents(fill=True) if name == "event_page"]
+    # The filled data arrives as arrays, packed as raw buffers.
+    assert all(isinstance(page["data"]["x"], numpy.ndarray) for page in filled)
+    numpy.testing.assert_array_equal(
+        numpy.concatenate([page["data"]["x"] for page in filled]), expected
+    )
+
+
+@pytest.mark.parametrize("queue_depth, chunk_bytesize", [(0, 0), (1, 0), (2, 1_000), (8, 1_000_000)])
+@_adapter_with(handler_registry={"COUNTING": _CountingHandler})
+def test_documents_producer(mongo_adapter, mongo_client, monkeypatch, queue_depth, chunk_bytesize):
+    monkeypatch.setattr(server, "DOCUMENTS_QUEUE_DEPTH", queue_depth)
+    monkeypatch.setattr(server, "DOCUMENTS_CHUNK_BYTESIZE", chunk_bytesize)
+    uid, _ = _insert_run_with_external_data(mongo_adapter, num_resources=2, num_events=30)
+    # Send many small documents.
+    monkeypatch.setattr(mongo_normalized, "TARGET_EVENT_PAGE_BYTESIZE", 1)
+    expected = list(mongo_adapter[uid].documents(fill=False))
+    actual = list(mongo_client[uid].documents())
+    assert [name for name, _ in actual] == [name for name, _ in expected]
+    assert [doc["uid"] for name, doc in actual if name == "event_page"] == [
+        doc["uid"] for name, doc in expected if name == "event_page"
+    ]
+
+
+@_adapter_with(handler_registry={"COUNTING": _CountingHandler})
+def test_post_documents_in_bulk(mongo_client, monkeypatch):
+    monkeypatch.setattr(server, "BULK_INSERT_BATCH_SIZE", 4)
+    source = MongoAdapter.from_mongomock(handler_registry={"COUNTING": _CountingHandler})
+    uid, expected = _insert_run_with_external_data(source, num_resources=2, num_events=10)
+    documents = list(source[uid].documents(fill=False, size=3))
+    assert {"event_page", "datum_page"} <= {name for name, _ in documents}
+
+    client = mongo_client
+    assert client.post_documents(documents) == len(documents)
+    assert client[uid].stop is not None
+    actual = client[uid]["primary"]["data"]["x"].read()
+    numpy.testing.assert_array_equal(actual, expected)
+    # Posting the same documents again is harmless.
+    assert client.post_documents(documents) == len(documents)
+    assert len(client[uid]["primary"]["data"]["x"].read()) == 10
+
+    # The documents before an invalid one are written.
+    bundle = event_model.compose_run()
+    with pytest.raises(ClientError, match="Document 1 is invalid"):
+        client.post_documents(
+            [("start", bundle.start_doc), ("stop", {"uid": "not a valid stop"})]
+        )
+    assert bundle.start_doc["uid"] in client
+    # ...including Events held back to be written together.
+    bundle = event_model.compose_run()
+    descriptor_bundle = bundle.compose_descriptor(
+        name="primary", data_keys={"x": {"source": "", "dtype": "number", "shape": []}}
+    )
+    event = descriptor_bundle.compose_event(data={"x": 1}, timestamps={"x": 0})
+    with pytest.raises(ClientError, match="Document 3 is invalid"):
+        client.post_documents(
+            [
+                ("start", bundle.start_doc),
+                ("descriptor", descriptor_bundle.descriptor_doc),
+                ("event", event),
+                ("stop", {"uid": "not a valid stop"}),
+            ]
+        )
+    assert len(client[bundle.start_doc["uid"]]["primary"]["data"]["x"].read()) == 1
+
+
+def test_client_document_cache(mongo_client, mongo_RE, tmpdir, monkeypatch):
+    cache_dir = tmpdir / "cache"
+    monkeypatch.setattr(client_module, "DOCUMENT_CACHE_DIR", str(cache_dir))
+    client = mongo_client
+    (uid,) = mongo_RE(count([det, img], 3))
+    run = client[uid]
+
+    # Stopping partway caches nothing.
+    documents = run.documents()
+    next(documents)
+    documents.close()
+    assert not list(cache_dir.visit("*.msgpack"))
+
+    expected = list(run.documents())
+    assert len(list(cache_dir.visit("*.msgpack"))) == 1
+
+    # Now the server is not needed.
+    def fail(*args, **kwargs):
+        raise AssertionError("The server was contacted.")
+
+    monkeypatch.setattr(client.context.http_client, "stream", fail)
+    actual = list(run.documents())
+    assert [name for name, _ in actual] == [name for name, _ in expected]
+    assert [doc for name, doc in actual if name in ("start", "descriptor", "stop")] == [
+        doc for name, doc in expected if name in ("start", "descriptor", "stop")
+    ]
+    # Other query parameters are cached separately.
+    with pytest.raises(AssertionError, match="server was contacted"):
+        list(run.documents(fill=True))
+    monkeypatch.undo()
+    monkeypatch.setattr(client_module, "DOCUMENT_CACHE_DIR", str(cache_dir))
+
+    # A run that is not done is never cached.
+    bundle = event_model.compose_run()
+    client.post_document("start", bundle.start_doc)
+    list(client[bundle.start_doc["uid"]].documents())
+    assert not cache_dir.join(bundle.start_doc["uid"]).exists()
+
+
+def test_lookup_many_runs_in_one_request(mongo_adapter, mongo_client, monkeypatch):
+    serializer = mongo_adapter.get_serializer()
+    uids = {}
+    for i, (uid, scan_id) in enumerate(
+        [("aaaaa1", 1), ("aaaaa2", 2), ("bbbbb1", 2), ("ccccc1", 3)]
+    ):
+        bundle = event_model.compose_run(
+            uid=uid + "-" * 30, time=i, metadata={"scan_id": scan_id, "purpose": str(scan_id)}
+        )
+        serializer("start", bundle.start_doc)
+        serializer("stop", bundle.compose_stop())
+        uids[uid] = bundle.start_doc["uid"]
+
+    calls = []
+    lookup = MongoAdapter.lookup
+    monkeypatch.setattr(
+        MongoAdapter, "lookup", lambda self, keys: calls.append(keys) or lookup(self, keys)
+    )
+    client = mongo_client
+    runs = client[[3, uids["aaaaa1"], "aaaaa2", 2, -1]]
+    assert len(calls) == 1
+    assert [run.start["uid"] for run in runs] == [
+        uids["ccccc1"],
+        uids["aaaaa1"],
+        uids["aaaaa2"],
+        # the latest run with scan_id 2
+        uids["bbbbb1"],
+        uids["ccccc1"],
+    ]
+    assert runs[0].metadata == client[uids["ccccc1"]].metadata
+    assert list(runs[0]) == list(client[uids["ccccc1"]])
+
+    with pytest.raises(KeyError, match="scan_id=4"):
+        client[[1, 4]]
+    with pytest.raises(KeyError, match="partial_uid ddddd"):
+        client[["ddddd"]]
+    with pytest.raises(KeyError, match="uid " + "d" * 36):
+        client[[3, "d" * 36]]
+    with pytest.raises(ClientError, match="multiple matches"):
+        client[["aaaaa"]]
+
+    # Keys are looked up within the search results.
+    results = client.search(Key("purpose") == "2")
+    assert [run.start["uid"] for run in results[[2, "aaaaa2"]]] == [
+        uids["bbbbb1"],
+        uids["aaaaa2"],
+    ]
+    with pytest.raises(KeyError):
+        results[[1]]
+
+    # True is not scan_id 1.
+    with pytest.raises(ValueError):
+        client[[True]]
+    link = client.item["links"]["self"].replace("/metadata", "/runs/lookup", 1)
+    response = client.context.http_client.post(link, json={"keys": [True]})
+    assert response.status_code == 422
+
+
+def test_lookup_runs_tiled_internals():
+    # POST /runs/lookup builds its response with these tiled internals,
+    # called as in tiled's GET /search route.
+    from tiled.server.core import apply_search, construct_resource
+    from tiled.server.utils import filter_for_access
+
+    assert inspect.iscoroutinefunction(construct_resource)
+    assert list(inspect.signature(construct_resource).parameters) == [
+        "base_url",
+        "path_parts",
+        "entry",
+        "fields",
+        "select_metadata",
+        "omit_links",
+        "include_data_sources",
+        "media_type",
+        "max_depth",
+        "depth",
+    ]
+    assert inspect.iscoroutinefunction(apply_search)
+    assert list(inspect.signature(apply_search).parameters) == ["tree", "filters", "query_registry"]
+    assert list(inspect.signature(filter_for_access).parameters) == [
+        "entry",
+        "principal",
+        "scopes",
+        "metrics",
+    ]
+
+
+def test_runs_are_made_a_page_at_a_time(mongo_adapter, monkeypatch):
+    monkeypatch.setattr(mongo_normalized, "CURSOR_LIMIT", 2)
+    adapter = mongo_adapter
+    serializer = adapter.get_serializer()
+    uids = []
+    for i in range(5):
+        bundle = event_model.compose_run(time=i)
+        serializer("start", bundle.start_doc)
+        for stream_name in ["primary", "baseline", "primary"]:
+            descriptor_bundle = bundle.compose_descriptor(
+                name=stream_name, data_keys={"x": {"source": "", "dtype": "number", "shape": []}}
+            )
+            serializer("descriptor", descriptor_bundle.descriptor_doc)
+        if i != 3:
+            serializer("stop", bundle.compose_stop())
+        uids.append(bundle.start_doc["uid"])
+
+    calls = []
+    for name in ["_get_stop_docs", "_get_stream_names"]:
+        method = getattr(MongoAdapter, name)
+        monkeypatch.setattr(
+            MongoAdapter,
+            name,
+            lambda self, uids, name=name, method=method: calls.append(name) or method(self, uids),
+        )
+    items = list(adapter.items())
+    assert [uid for uid, _ in items] == uids
+    # one query for each of 3 pages
+    assert calls.count("_get_stop_docs") == calls.count("_get_stream_names") == 3
+    for i, (uid, run) in enumerate(items):
+        assert list(run) == ["primary", "baseline"]
+        assert (run.metadata()["stop"] is None) == (i == 3)
+    assert uids[3] in adapter._cache_of_partial_bluesky_runs
+    assert uids[4] in adapter._cache_of_complete_bluesky_runs
+
+    # Runs already made are not made again.
+    calls.clear()
+    list(adapter.items())
+    assert adapter[uids[0]] is items[0][1]
+    assert not calls
@@ -0,0 +1,66 @@
+import msgpack
+import numpy
+import pytest
+
+from .._msgpack_arrays import NDARRAY_EXT_TYPE, as_arrays, default, ext_hook
+
+
+def _round_trip(obj):
+    return msgpack.unpackb(msgpack.packb(obj, default=default), ext_hook=ext_hook)
+
+
+@pytest.mark.parametrize(
+    "array",
+    [
+        numpy.arange(12, dtype="int32").reshape(3, 4),
+        numpy.linspace(0, 1, 7),
+        numpy.array(3.5),
+        numpy.zeros((0, 4)),
+        numpy.array([True, False]),
+        numpy.ones(3, dtype="complex128"),
+        numpy.arange(10, dtype=">f4")[::2],  # not contiguous, big-endian
+    ],
+)
+def test_round_trip(array):
+    actual = _round_trip({"x": array})["x"]
+    assert isinstance(actual, numpy.ndarray)
+    assert actual.dtype == array.dtype
+    numpy.testing.assert_array_equal(actual, array)
+    assert actual.flags.writeable
+    actual[...] = 0
+
+
+def test_other_kinds_as_lists():
+    assert _round_trip({"x": numpy.array(["a", "b"]), "y": numpy.float32(2)}) == {
+        "x": ["a", "b"],
+        "y": 2.0,
+    }
+    # Other extension types pass through.
+    assert _round_trip(msgpack.ExtType(NDARRAY_EXT_TYPE + 1, b"abc")) == msgpack.ExtType(
+        NDARRAY_EXT_TYPE + 1, b"abc"
+    )
+
+
+def test_as_arrays():
+    event_page = {
+        "time": [1.0, 2.0],
+        "seq_num": [1, 2],
+        "uid": ["a", "b"],
+        "descriptor": "d",
+        "filled": {"img": ["a/0", "a/1"]},
+        "data": {
+            "det": [1, 2.5],
+            "img": [numpy.zeros((2, 3)), numpy.ones((2, 3))],
+            "ragged": [[1], [1, 2]],
+            "name": ["x", "y"],
+        },
+        "timestamps": {"det": [1.0, 2.0], "img": [1.0, 2.0], "ragged": [1, 2], "name": [1, 2]},
+    }
+    actual = as_arrays(event_page)
+    assert actual["seq_num"].dtype == "int64"
+    # ints mixed with floats are coerced to float64
+    assert actual["data"]["det"].dtype == "float64"
+    assert actual["data"]["img"].shape == (2, 2, 3)
+    assert actual["data"]["ragged"] == [[1], [1, 2]]
+    assert actual["data"]["name"] == ["x", "y"]
+    assert actual["uid"] == ["a", "b"]
@@ -1,10 +1,17 @@
+import numpy
+import pytest
 from bluesky import RunEngine
 from bluesky.plans import count
 from ophyd.sim import img
 from tiled.client import Context, from_context
 from tiled.server.app import build_app
 
-from ..mongo_normalized import MongoAdapter
+from ..mongo_normalized import (
+    BadShapeMetadata,
+    MongoAdapter,
+    default_validate_column_shape,
+    default_validate_shape,
+)
 
 
 def test_validate_shape(tmpdir):
@@ -29,3 +36,43 @@ def test_validate_shape(tmpdir):
         assert not shapes
         client[uid]["primary"]["data"]["img"][:]
         assert shapes
+
+
+@pytest.mark.parametrize(
+    "shapes",
+    [
+        [(3, 4)] * 5,
+        # off by one or two, in either direction
+        [(3, 4), (2, 4), (3, 3), (3, 4), (2, 4), (4, 5), (3, 6)],
+        [],
+    ],
+)
+def test_validate_column_shape(shapes):
+    rows = [numpy.random.random(shape) for shape in shapes]
+    expected = numpy.empty((0, 3, 4))
+    if rows:
+        expected = numpy.stack([default_validate_shape("x", row, (3, 4)) for row in rows])
+    actual = default_validate_column_shape("x", rows, (3, 4))
+    assert actual.shape == (len(rows), 3, 4)
+    numpy.testing.assert_array_equal(actual, expected)
+    if rows:
+        # An array of rows is handled too.
+        stacked = numpy.stack([rows[0]] * 3)
+        assert default_validate_column_shape("x", stacked, (3, 4)) is stacked
+        numpy.testing.assert_array_equal(
+            default_validate_column_shape("x", stacked, (2, 4)), stacked[:, :2]
+        )
+
+
+def test_validate_column_shape_promotes_dtype():
+    rows = [numpy.ones(3, dtype=int), numpy.full(2, 0.5)]
+    actual = default_validate_column_shape("x", rows, (3,))
+    assert actual.dtype == numpy.dtype("float64")
+    numpy.testing.assert_array_equal(actual, [[1, 1, 1], [0.5, 0.5, 0.5]])
+
+
+@pytest.mark.parametrize("shape", [(3,), (3, 7), (3, 4, 1)])
+def test_validate_column_shape_raises(shape):
+    rows = [numpy.ones((3, 4)), numpy.ones(shape)]
+    with pytest.raises(BadShapeMetadata):
+        default_validate_column_shape("x", rows, (3, 4))